@@ -0,0 +1,214 @@
+import json
+import os
+import shutil
+import time
+from config import Config
+from deploy_state import hash_file
+from downloader import VALIDATOR_SUFFIX
+
+class DiskCache:
+    """Content-addressed files in a directory with least-recently-used eviction.
+
+    Keys are immutable identifiers (commit or blob SHAs), so a cached file can be
+    reused forever. Entries are evicted oldest-access first once the cache exceeds
+    its size or entry limit. `.part` files count toward the size limit but are only
+    removed once they are older than `partial_max_age` seconds, since a download may
+    still be writing to them.
+    """
+
+    suffix = ''
+
+    def __init__(self, cache_dir, max_bytes, max_entries, partial_max_age=None):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.partial_max_age = (
+            Config.CACHE_PARTIAL_MAX_AGE_HOURS * 3600 if partial_max_age is None else partial_max_age
+        )
+
+    def path_for(self, key):
+        return os.path.join(self.cache_dir, f"{key}{self.suffix}")
+
+    def partial_path_for(self, key):
+        """Path to write into before the entry is complete and added with put()."""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        return self.path_for(key) + '.part'
+
+    def get(self, key):
+        """Return the cached path for a key, or None on a miss."""
+        path = self.path_for(key)
+        if not os.path.exists(path):
+            return None
+        # Bump mtime so the entry counts as recently used
+        os.utime(path, None)
+        return path
+
+    def put(self, key, source_path, evict=True):
+        """Move a finished file into the cache and return its cached path."""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self.path_for(key)
+        os.replace(source_path, path)
+        if evict:
+            self.evict(keep=path)
+        return path
+
+    def fits(self, size):
+        """Whether a file of `size` bytes can be kept without evicting it straight away."""
+        return self.max_entries > 0 and size <= self.max_bytes
+
+    def evict(self, keep=None):
+        """Remove least-recently-used entries until the cache fits its limits."""
+        if not os.path.isdir(self.cache_dir):
+            return
+        now = time.time()
+        entries = []
+        partial_bytes = 0
+        for name in os.listdir(self.cache_dir):
+            partial = name.endswith(('.part', '.part' + VALIDATOR_SUFFIX))
+            if not partial and not name.endswith(self.suffix):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            if partial:
+                if self.partial_max_age and now - stat.st_mtime > self.partial_max_age:
+                    try:
+                        os.remove(path)
+                        continue
+                    except OSError:
+                        pass
+                partial_bytes += stat.st_size
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort()
+        total_bytes = partial_bytes + sum(size for _, size, _ in entries)
+        while entries and (total_bytes > self.max_bytes or len(entries) > self.max_entries):
+            _, size, path = entries.pop(0)
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+                total_bytes -= size
+            except OSError:
+                pass
+
+class ArchiveCache(DiskCache):
+    """On-disk cache of repository zipballs keyed by commit SHA."""
+
+    suffix = '.zip'
+
+    def __init__(self, cache_dir=None, max_bytes=None, max_entries=None):
+        super().__init__(
+            cache_dir or Config.ARCHIVE_CACHE_DIR,
+            Config.ARCHIVE_CACHE_MAX_MB * 1024 * 1024 if max_bytes is None else max_bytes,
+            Config.ARCHIVE_CACHE_MAX_ENTRIES if max_entries is None else max_entries
+        )
+
+class BlobCache(DiskCache):
+    """On-disk cache of git blob contents keyed by blob SHA."""
+
+    suffix = '.blob'
+
+    def __init__(self, cache_dir=None, max_bytes=None, max_entries=None):
+        super().__init__(
+            cache_dir or Config.BLOB_CACHE_DIR,
+            Config.BLOB_CACHE_MAX_MB * 1024 * 1024 if max_bytes is None else max_bytes,
+            Config.BLOB_CACHE_MAX_ENTRIES if max_entries is None else max_entries
+        )
+
+    def copy_to(self, blob_sha, dest):
+        """Copy a cached blob to `dest`. Returns False on a miss."""
+        path = self.get(blob_sha)
+        if path is None:
+            return False
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        shutil.copyfile(path, dest)
+        return True
+
+    def add_file(self, blob_sha, source_path):
+        """Store a copy of a downloaded blob. Eviction is left to the caller, once per batch."""
+        partial_path = self.partial_path_for(blob_sha)
+        shutil.copyfile(source_path, partial_path)
+        self.put(blob_sha, partial_path, evict=False)
+
+class LuauModuleCache(DiskCache):
+    """On-disk cache of JSON data files compiled to Luau, keyed by source hash and serializer version."""
+
+    suffix = '.luau'
+
+    def __init__(self, cache_dir=None, max_bytes=None, max_entries=None):
+        super().__init__(
+            cache_dir or Config.LUAU_CACHE_DIR,
+            Config.LUAU_CACHE_MAX_MB * 1024 * 1024 if max_bytes is None else max_bytes,
+            Config.LUAU_CACHE_MAX_ENTRIES if max_entries is None else max_entries
+        )
+
+class PlaceCache(DiskCache):
+    """Last published .rbxl of each place, keyed by place ID.
+
+    Unlike the SHA-keyed caches an entry is replaced on every publish, so each
+    file has a `.json` sidecar with the version number it was published as and
+    its sha256. It is only reused while that version is still the live one.
+    """
+
+    suffix = '.rbxl'
+
+    def __init__(self, cache_dir=None, max_bytes=None, max_entries=None):
+        super().__init__(
+            cache_dir or Config.PLACE_CACHE_DIR,
+            Config.PLACE_CACHE_MAX_MB * 1024 * 1024 if max_bytes is None else max_bytes,
+            Config.PLACE_CACHE_MAX_ENTRIES if max_entries is None else max_entries
+        )
+
+    def _meta_path(self, place_id):
+        return self.path_for(place_id) + '.json'
+
+    def evict(self, keep=None):
+        """Evict like DiskCache, then remove the sidecars of place files that are gone."""
+        super().evict(keep)
+        if not os.path.isdir(self.cache_dir):
+            return
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(self.suffix + '.json'):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            if not os.path.exists(path[:-len('.json')]):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def lookup(self, place_id):
+        """Return the cached entry's metadata ({version, sha256}), or None on a miss."""
+        if self.get(place_id) is None:
+            return None
+        try:
+            with open(self._meta_path(place_id), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def store(self, place_id, source_path, version):
+        """Move a just-published place file into the cache under its version number."""
+        meta = {'version': version, 'sha256': hash_file(source_path)}
+        # Drop the old metadata first so a crash in between leaves a miss, not a wrong version
+        try:
+            os.remove(self._meta_path(place_id))
+        except OSError:
+            pass
+        self.put(place_id, source_path)
+        tmp_path = self._meta_path(place_id) + '.part'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, self._meta_path(place_id))
+
+    def copy_to(self, place_id, destination, expected_sha256):
+        """Copy the cached place file to `destination` if its hash is still intact."""
+        os.makedirs(os.path.dirname(destination) or '.', exist_ok=True)
+        shutil.copyfile(self.path_for(place_id), destination)
+        if hash_file(destination) != expected_sha256:
+            os.remove(destination)
+            return False
+        return True
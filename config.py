@@ -1,8 +1,29 @@
 import os
+from collections import namedtuple
 from dotenv import load_dotenv
 
 load_dotenv()
 
+DeployTarget = namedtuple('DeployTarget', ['name', 'place_id', 'universe_id'])
+
+def parse_deploy_targets(spec, default_place_id, default_universe_id):
+    """Parse DEPLOY_TARGETS ("name:place_id[:universe_id],...") into DeployTarget tuples.
+
+    Without a spec, the single PLACE_ID/UNIVERSE_ID pair is the only target.
+    """
+    targets = []
+    for entry in (spec or '').split(','):
+        parts = [part.strip() for part in entry.split(':')]
+        if not parts[0]:
+            continue
+        if len(parts) not in (2, 3):
+            raise ValueError(f"Invalid DEPLOY_TARGETS entry {entry!r}, expected name:place_id[:universe_id]")
+        universe_id = int(parts[2]) if len(parts) == 3 else default_universe_id
+        targets.append(DeployTarget(parts[0], int(parts[1]), universe_id))
+    if not targets:
+        targets.append(DeployTarget('main', default_place_id, default_universe_id))
+    return targets
+
 class Config:
     DISCORD_TOKEN = os.getenv('DISCORD_TOKEN')
     GUILD_ID = int(os.getenv('GUILD_ID', 0))
@@ -10,16 +31,116 @@ class Config:
     GITHUB_TOKEN = os.getenv('GITHUB_TOKEN')
     GITHUB_REPO = os.getenv('GITHUB_REPO') 
     GITHUB_BRANCH = os.getenv('GITHUB_BRANCH', 'main')
+    # Override for GitHub Enterprise or a local test server
+    GITHUB_API_URL = os.getenv('GITHUB_API_URL', 'https://api.github.com').rstrip('/')
     
     ROBLOX_API_KEY = os.getenv('ROBLOX_API_KEY')
+    OPEN_CLOUD_API_URL = os.getenv('OPEN_CLOUD_API_URL', 'https://apis.roblox.com').rstrip('/')
     PLACE_ID = int(os.getenv('PLACE_ID', 0))
     UNIVERSE_ID = int(os.getenv('UNIVERSE_ID', 0))
+    # Places that receive the same Data modules; defaults to PLACE_ID/UNIVERSE_ID
+    DEPLOY_TARGETS = parse_deploy_targets(os.getenv('DEPLOY_TARGETS', ''), PLACE_ID, UNIVERSE_ID)
+    # Places processed in parallel, and rbxcloud calls allowed per minute per API key
+    DEPLOY_WORKERS = int(os.getenv('DEPLOY_WORKERS', 2))
+    OPEN_CLOUD_REQUESTS_PER_MINUTE = int(os.getenv('OPEN_CLOUD_REQUESTS_PER_MINUTE', 30))
+    GITHUB_REQUESTS_PER_MINUTE = int(os.getenv('GITHUB_REQUESTS_PER_MINUTE', 300))
+    # Retries of 429/5xx/connection errors, base backoff (seconds), and the longest rate-limit wait before failing
+    REQUEST_MAX_RETRIES = int(os.getenv('REQUEST_MAX_RETRIES', 4))
+    REQUEST_BACKOFF_SECONDS = float(os.getenv('REQUEST_BACKOFF_SECONDS', 1))
+    RATE_LIMIT_MAX_WAIT_SECONDS = float(os.getenv('RATE_LIMIT_MAX_WAIT_SECONDS', 300))
     
     TEMP_DIR = os.getenv('TEMP_DIR', './temp')
     PLACE_FILE_PATH = os.path.join(TEMP_DIR, 'place.rbxl')
     DATA_FILES_DIR = os.path.join(TEMP_DIR, 'data_files')
+    # Each deploy job gets its own working directory under here
+    JOBS_DIR = os.path.join(TEMP_DIR, 'jobs')
+    # Scratch space one run may use (job directory plus the archive download); 0 means no cap
+    SCRATCH_MAX_MB = int(os.getenv('SCRATCH_MAX_MB', 0))
+    # Fail a run instead of filling the disk below this much free space
+    MIN_FREE_DISK_MB = int(os.getenv('MIN_FREE_DISK_MB', 256))
+    # Seconds between memory samples while a run is in progress
+    RESOURCE_SAMPLE_INTERVAL = float(os.getenv('RESOURCE_SAMPLE_INTERVAL', 0.5))
+    
+    # Persistent state kept outside TEMP_DIR (survives cleanup and restarts)
+    STATE_DIR = os.getenv('STATE_DIR', './state')
+    DEPLOY_STATE_PATH = os.path.join(STATE_DIR, 'deploy_state.json')
+    METRICS_PATH = os.path.join(STATE_DIR, 'metrics.jsonl')
+    # Hash of the last slash-command tree pushed to Discord; startup skips the sync when it matches
+    COMMAND_TREE_HASH_PATH = os.path.join(STATE_DIR, 'command_tree.json')
+    FORCE_COMMAND_SYNC = os.getenv('FORCE_COMMAND_SYNC', 'false').lower() in ('1', 'true', 'yes')
+    METRICS_MAX_SAMPLES = int(os.getenv('METRICS_MAX_SAMPLES', 200))
+    # Prometheus /metrics endpoint; 0 disables it
+    METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+    METRICS_PORT = int(os.getenv('METRICS_PORT', 0))
+    CACHE_DIR = os.getenv('CACHE_DIR', './cache')
+    ARCHIVE_CACHE_DIR = os.path.join(CACHE_DIR, 'archives')
+    ARCHIVE_CACHE_MAX_MB = int(os.getenv('ARCHIVE_CACHE_MAX_MB', 500))
+    ARCHIVE_CACHE_MAX_ENTRIES = int(os.getenv('ARCHIVE_CACHE_MAX_ENTRIES', 10))
+    BLOB_CACHE_DIR = os.path.join(CACHE_DIR, 'blobs')
+    BLOB_CACHE_MAX_MB = int(os.getenv('BLOB_CACHE_MAX_MB', 100))
+    BLOB_CACHE_MAX_ENTRIES = int(os.getenv('BLOB_CACHE_MAX_ENTRIES', 5000))
+    # Unfinished downloads in the caches are kept this long so a later run can resume them
+    CACHE_PARTIAL_MAX_AGE_HOURS = float(os.getenv('CACHE_PARTIAL_MAX_AGE_HOURS', 24))
+    # JSON data files are compiled to Luau table literals and cached by content hash
+    COMPILE_JSON_TO_LUAU = os.getenv('COMPILE_JSON_TO_LUAU', 'true').lower() in ('1', 'true', 'yes')
+    LUAU_CACHE_DIR = os.path.join(CACHE_DIR, 'luau')
+    LUAU_CACHE_MAX_MB = int(os.getenv('LUAU_CACHE_MAX_MB', 200))
+    LUAU_CACHE_MAX_ENTRIES = int(os.getenv('LUAU_CACHE_MAX_ENTRIES', 5000))
+    # Last published place file per place, reused while its version is still live
+    PLACE_CACHE_ENABLED = os.getenv('PLACE_CACHE_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+    PLACE_CACHE_DIR = os.path.join(CACHE_DIR, 'places')
+    PLACE_CACHE_MAX_MB = int(os.getenv('PLACE_CACHE_MAX_MB', 1000))
+    PLACE_CACHE_MAX_ENTRIES = int(os.getenv('PLACE_CACHE_MAX_ENTRIES', 10))
+    
+    # Delta fetch: download only changed blobs when fewer than DELTA_MAX_FILES changed
+    DELTA_MAX_FILES = int(os.getenv('DELTA_MAX_FILES', 100))
+    DELTA_CONCURRENCY = int(os.getenv('DELTA_CONCURRENCY', 8))
+    
+    # Repo-relative folders holding the data modules, tried in order
+    DATA_ROOTS = [p.strip().strip('/') for p in os.getenv(
+        'DATA_ROOTS', 'AV Balancing/src/ReplicatedStorage/Modules/Data,src/ReplicatedStorage/Modules/Data'
+    ).split(',') if p.strip()]
+    
+    # Data validation before the Roblox steps; SCHEMA_DIR holds optional <folder>/schema.json files
+    VALIDATION_ENABLED = os.getenv('VALIDATION_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+    VALIDATION_WORKERS = int(os.getenv('VALIDATION_WORKERS', min(4, os.cpu_count() or 1)))
+    # Smaller batches are validated in-process; starting worker processes would cost more
+    VALIDATION_POOL_MIN_FILES = int(os.getenv('VALIDATION_POOL_MIN_FILES', 50))
+    SCHEMA_DIR = os.getenv('SCHEMA_DIR', '')
+    
+    # GitHub push webhook auto-deploy; 0 disables the listener
+    WEBHOOK_HOST = os.getenv('WEBHOOK_HOST', '0.0.0.0')
+    WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', 0))
+    WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/github')
+    WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', '')
+    WEBHOOK_BRANCHES = [b.strip() for b in os.getenv('WEBHOOK_BRANCHES', GITHUB_BRANCH).split(',') if b.strip()]
+    WEBHOOK_DEBOUNCE_SECONDS = float(os.getenv('WEBHOOK_DEBOUNCE_SECONDS', 30))
+    WEBHOOK_MAX_BODY_BYTES = int(os.getenv('WEBHOOK_MAX_BODY_BYTES', 5 * 1024 * 1024))
+    # Channel that receives the results of webhook-triggered deploys
+    DEPLOY_CHANNEL_ID = int(os.getenv('DEPLOY_CHANNEL_ID', 0))
     
     LUNE_SCRIPT_PATH = os.getenv('LUNE_SCRIPT_PATH', './lune_sync.luau')
+    # Keep one Lune process running and reuse the place it has loaded between syncs
+    LUNE_PERSISTENT_WORKER = os.getenv('LUNE_PERSISTENT_WORKER', 'false').lower() in ('1', 'true', 'yes')
+    LUNE_WORKER_START_TIMEOUT = int(os.getenv('LUNE_WORKER_START_TIMEOUT', 30))
+    
+    # Shared HTTP connection pool (timeouts in seconds)
+    HTTP_POOL_SIZE = int(os.getenv('HTTP_POOL_SIZE', 20))
+    HTTP_POOL_SIZE_PER_HOST = int(os.getenv('HTTP_POOL_SIZE_PER_HOST', 8))
+    HTTP_KEEPALIVE_TIMEOUT = float(os.getenv('HTTP_KEEPALIVE_TIMEOUT', 60))
+    HTTP_DNS_CACHE_TTL = int(os.getenv('HTTP_DNS_CACHE_TTL', 300))
+    HTTP_CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT', 10))
+    HTTP_READ_TIMEOUT = float(os.getenv('HTTP_READ_TIMEOUT', 60))
+    
+    # Large downloads: retries with backoff (seconds), write buffer (bytes), progress update interval (seconds)
+    DOWNLOAD_RETRIES = int(os.getenv('DOWNLOAD_RETRIES', 4))
+    DOWNLOAD_BACKOFF_SECONDS = float(os.getenv('DOWNLOAD_BACKOFF_SECONDS', 1))
+    DOWNLOAD_BUFFER_SIZE = int(os.getenv('DOWNLOAD_BUFFER_SIZE', 1024 * 1024))
+    DOWNLOAD_PROGRESS_INTERVAL = float(os.getenv('DOWNLOAD_PROGRESS_INTERVAL', 2))
+    
+    # Per-step subprocess timeouts (seconds)
+    RBXCLOUD_TIMEOUT = int(os.getenv('RBXCLOUD_TIMEOUT', 900))
+    LUNE_TIMEOUT = int(os.getenv('LUNE_TIMEOUT', 600))
     
     ALLOWED_ROLES = os.getenv('ALLOWED_ROLES', '').split(',')  
     ALLOWED_USERS = os.getenv('ALLOWED_USERS', '').split(',')  
@@ -0,0 +1,306 @@
+import json
+import logging
+import os
+import re
+from config import Config
+from deploy_state import SYNCED_SUFFIXES
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_FILE_NAME = 'schema.json'
+
+_BLOCK_OPENERS = {'function', 'do', 'if'}
+# An `if` right after one of these is an if-then-else expression, which has no `end`
+_EXPRESSION_BEFORE = {
+    '=', '(', '[', '{', ',', '+', '-', '*', '/', '%', '^', '#', '.', '<', '>',
+    'return', 'and', 'or', 'not', 'in',
+}
+_CLOSING = {')': '(', ']': '[', '}': '{'}
+_LONG_BRACKET = re.compile(r'\[(=*)\[')
+_NAME = re.compile(r'[A-Za-z_][A-Za-z0-9_]*')
+_NUMBER = re.compile(r'[0-9][0-9A-Za-z_.]*')
+
+class DataValidationError(Exception):
+    """Raised when data files fail validation; `errors` holds one "path:line: message" per problem."""
+
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__(f"{len(errors)} data file error(s), nothing was published:\n" + "\n".join(errors[:10]))
+
+def check_json(text):
+    """Parse JSON text. Returns (value, errors), errors as (line, message) tuples."""
+    try:
+        return json.loads(text), []
+    except json.JSONDecodeError as e:
+        return None, [(e.lineno, f"invalid JSON: {e.msg} (column {e.colno})")]
+
+def check_luau(text):
+    """Cheap structural check of Luau source: strings, comments, brackets and blocks.
+
+    This is not a parser; it catches the usual hand-editing mistakes (an unclosed
+    brace or string, a missing `end`) with the line they start on. `if` expressions
+    (`local x = if a then 1 else 2`) are told apart from `if` statements by the token
+    before them.
+    Returns a list of (line, message) tuples.
+    """
+    errors = []
+    brackets = []  # (char, line)
+    blocks = []  # (keyword, line)
+    # Nesting depth (blocks, brackets) of each if-expression still waiting for its `else`
+    expression_ifs = []
+    # Previous token; `then`/`else` of an if-expression become 'then-expr'/'else-expr'
+    previous = None
+    i, line, n = 0, 1, len(text)
+    while i < n:
+        c = text[i]
+        if c == '\n':
+            line += 1
+            i += 1
+        elif text.startswith('--', i):
+            long_match = _LONG_BRACKET.match(text, i + 2)
+            if long_match:
+                close = text.find(']' + long_match.group(1) + ']', long_match.end())
+                if close < 0:
+                    errors.append((line, "unfinished long comment"))
+                    return errors
+                line += text.count('\n', i, close)
+                i = close + len(long_match.group(1)) + 2
+            else:
+                end = text.find('\n', i)
+                i = n if end < 0 else end
+        elif c in '"\'`':
+            start_line = line
+            i += 1
+            while i < n and text[i] != c:
+                if text[i] == '\\':
+                    if i + 1 < n and text[i + 1] == '\n':
+                        line += 1
+                    i += 2
+                    continue
+                if text[i] == '\n':
+                    break
+                i += 1
+            if i >= n or text[i] != c:
+                errors.append((start_line, "unfinished string"))
+            else:
+                i += 1
+            previous = 'value'
+        elif c == '[' and _LONG_BRACKET.match(text, i):
+            long_match = _LONG_BRACKET.match(text, i)
+            close = text.find(']' + long_match.group(1) + ']', long_match.end())
+            if close < 0:
+                errors.append((line, "unfinished long string"))
+                return errors
+            line += text.count('\n', i, close)
+            i = close + len(long_match.group(1)) + 2
+            previous = 'value'
+        elif c in '([{':
+            brackets.append((c, line))
+            previous = c
+            i += 1
+        elif c in ')]}':
+            if not brackets or brackets[-1][0] != _CLOSING[c]:
+                errors.append((line, f"unexpected '{c}'"))
+            else:
+                brackets.pop()
+            previous = c
+            i += 1
+        elif c.isalpha() or c == '_':
+            word = _NAME.match(text, i).group(0)
+            depth = (len(blocks), len(brackets))
+            # `a.end` / `a:do` are field names, not keywords
+            if i > 0 and text[i - 1] in '.:':
+                word = 'value'
+            elif word == 'if' and (previous in _EXPRESSION_BEFORE or previous in ('then-expr', 'else-expr')):
+                expression_ifs.append(depth)
+            elif word in ('then', 'else', 'elseif') and expression_ifs and expression_ifs[-1] == depth:
+                if word == 'else':
+                    expression_ifs.pop()
+                    word = 'else-expr'
+                elif word == 'then':
+                    word = 'then-expr'
+            else:
+                if word in _BLOCK_OPENERS or word == 'repeat':
+                    blocks.append((word, line))
+                elif word == 'end':
+                    if not blocks or blocks[-1][0] == 'repeat':
+                        errors.append((line, "'end' without a matching block"))
+                    else:
+                        blocks.pop()
+                elif word == 'until':
+                    if not blocks or blocks[-1][0] != 'repeat':
+                        errors.append((line, "'until' without a matching 'repeat'"))
+                    else:
+                        blocks.pop()
+            i += len(_NAME.match(text, i).group(0))
+            previous = word
+        elif c.isdigit():
+            i = _NUMBER.match(text, i).end()
+            previous = 'value'
+        elif c.isspace():
+            i += 1
+        else:
+            previous = c
+            i += 1
+    for char, open_line in brackets:
+        errors.append((open_line, f"'{char}' is never closed"))
+    for keyword, open_line in blocks:
+        errors.append((open_line, f"'{keyword}' is never closed"))
+    if expression_ifs:
+        errors.append((line, "'if' expression without an 'else'"))
+    return errors
+
+def _type_matches(value, expected):
+    if expected == 'object':
+        return isinstance(value, dict)
+    if expected == 'array':
+        return isinstance(value, list)
+    if expected == 'string':
+        return isinstance(value, str)
+    if expected == 'boolean':
+        return isinstance(value, bool)
+    if expected == 'null':
+        return value is None
+    if expected == 'integer':
+        return isinstance(value, int) and not isinstance(value, bool)
+    if expected == 'number':
+        return isinstance(value, (int, float)) and not isinstance(value, bool)
+    return True
+
+def check_schema(value, schema, path='$'):
+    """Check a JSON value against a JSON Schema subset.
+
+    Supports type, enum, required, properties, additionalProperties, items,
+    minItems/maxItems, minLength/maxLength, pattern and minimum/maximum.
+    Returns a list of "<json path>: message" strings.
+    """
+    errors = []
+    expected = schema.get('type')
+    if expected is not None:
+        types = expected if isinstance(expected, list) else [expected]
+        if not any(_type_matches(value, t) for t in types):
+            return [f"{path}: expected {' or '.join(types)}, got {type(value).__name__}"]
+    if 'enum' in schema and value not in schema['enum']:
+        errors.append(f"{path}: {value!r} is not one of {schema['enum']}")
+    if isinstance(value, dict):
+        for key in schema.get('required', []):
+            if key not in value:
+                errors.append(f"{path}: missing required key {key!r}")
+        properties = schema.get('properties', {})
+        extra = schema.get('additionalProperties', True)
+        for key, item in value.items():
+            if key in properties:
+                errors.extend(check_schema(item, properties[key], f"{path}.{key}"))
+            elif extra is False:
+                errors.append(f"{path}: unexpected key {key!r}")
+            elif isinstance(extra, dict):
+                errors.extend(check_schema(item, extra, f"{path}.{key}"))
+    elif isinstance(value, list):
+        if 'minItems' in schema and len(value) < schema['minItems']:
+            errors.append(f"{path}: fewer than {schema['minItems']} items")
+        if 'maxItems' in schema and len(value) > schema['maxItems']:
+            errors.append(f"{path}: more than {schema['maxItems']} items")
+        if isinstance(schema.get('items'), dict):
+            for index, item in enumerate(value):
+                errors.extend(check_schema(item, schema['items'], f"{path}[{index}]"))
+    elif isinstance(value, str):
+        if 'minLength' in schema and len(value) < schema['minLength']:
+            errors.append(f"{path}: shorter than {schema['minLength']} characters")
+        if 'maxLength' in schema and len(value) > schema['maxLength']:
+            errors.append(f"{path}: longer than {schema['maxLength']} characters")
+        if 'pattern' in schema and not re.search(schema['pattern'], value):
+            errors.append(f"{path}: does not match {schema['pattern']!r}")
+    elif isinstance(value, (int, float)) and not isinstance(value, bool):
+        if 'minimum' in schema and value < schema['minimum']:
+            errors.append(f"{path}: {value} is below the minimum {schema['minimum']}")
+        if 'maximum' in schema and value > schema['maximum']:
+            errors.append(f"{path}: {value} is above the maximum {schema['maximum']}")
+    return errors
+
+def validate_file(path, relative_path, schema=None):
+    """Validate one data file. Returns a list of "relative/path:line: message" strings."""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            text = f.read()
+    except UnicodeDecodeError:
+        return [f"{relative_path}:1: not valid UTF-8"]
+    except OSError as e:
+        return [f"{relative_path}:1: could not read file ({e})"]
+
+    if relative_path.endswith('.json'):
+        value, problems = check_json(text)
+        errors = [f"{relative_path}:{line}: {message}" for line, message in problems]
+        if not problems and schema is not None:
+            errors.extend(f"{relative_path}: {message}" for message in check_schema(value, schema))
+        return errors
+    return [f"{relative_path}:{line}: {message}" for line, message in check_luau(text)]
+
+def _validate_batch(batch):
+    return [(relative_path, validate_file(path, relative_path, schema)) for path, relative_path, schema in batch]
+
+def load_schemas(schema_dir):
+    """Load SCHEMA_DIR/<folder>/schema.json files as {relative folder ('' for the root): schema}."""
+    schemas = {}
+    if not schema_dir or not os.path.isdir(schema_dir):
+        return schemas
+    for current, _, files in os.walk(schema_dir):
+        if SCHEMA_FILE_NAME not in files:
+            continue
+        folder = os.path.relpath(current, schema_dir).replace(os.sep, '/')
+        folder = '' if folder == '.' else folder
+        path = os.path.join(current, SCHEMA_FILE_NAME)
+        with open(path, 'r', encoding='utf-8') as f:
+            try:
+                schemas[folder] = json.load(f)
+            except json.JSONDecodeError as e:
+                raise Exception(f"Invalid schema {path}: {e}")
+    return schemas
+
+def schema_for(relative_path, schemas):
+    """Return the schema of the nearest folder above `relative_path` that has one."""
+    folder = relative_path.rsplit('/', 1)[0] if '/' in relative_path else ''
+    while True:
+        if folder in schemas:
+            return schemas[folder]
+        if not folder:
+            return None
+        folder = folder.rsplit('/', 1)[0] if '/' in folder else ''
+
+def validate_data_files(data_root, schema_dir=None, max_workers=None):
+    """Validate every synced data file under `data_root` using a process pool.
+
+    JSON files are parsed (and checked against their folder's schema, if any);
+    Luau files get a structural check. Returns all errors, ordered by path.
+    """
+    schemas = load_schemas(schema_dir if schema_dir is not None else Config.SCHEMA_DIR)
+    files = []
+    for current, _, names in os.walk(data_root):
+        for name in names:
+            if not name.endswith(SYNCED_SUFFIXES):
+                continue
+            path = os.path.join(current, name)
+            relative_path = os.path.relpath(path, data_root).replace(os.sep, '/')
+            schema = schema_for(relative_path, schemas) if relative_path.endswith('.json') else None
+            files.append((path, relative_path, schema))
+    if not files:
+        return []
+
+    max_workers = max(1, min(max_workers or Config.VALIDATION_WORKERS, len(files)))
+    if max_workers == 1 or len(files) < Config.VALIDATION_POOL_MIN_FILES:
+        results = _validate_batch(files)
+    else:
+        # A few batches per worker keeps the pickling overhead low and the load balanced
+        batch_count = max_workers * 4
+        batches = [files[i::batch_count] for i in range(batch_count) if files[i::batch_count]]
+        # Imported here: multiprocessing is only needed for large trees, not at bot startup
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        # Never fork: this runs in a worker thread of a process with an event loop and other
+        # threads, and a forked child can deadlock on a lock one of them held at the time
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+        results = []
+        with ProcessPoolExecutor(max_workers=max_workers, mp_context=context) as pool:
+            for batch_results in pool.map(_validate_batch, batches):
+                results.extend(batch_results)
+    return [error for _, file_errors in sorted(results) for error in file_errors]
@@ -0,0 +1,122 @@
+import asyncio
+import itertools
+import logging
+import os
+import shutil
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+class DeployJob:
+    """One queued deploy of a branch, possibly shared by several requesters."""
+
+    def __init__(self, job_id: int, branch: str, force: bool):
+        self.job_id = job_id
+        self.branch = branch
+        self.force = force
+        self.workdir = os.path.join(Config.JOBS_DIR, f"job-{job_id}")
+        self.listeners = []
+        self.requesters = 0
+        self.started = False
+        self.future = asyncio.get_running_loop().create_future()
+
+    def add_listener(self, listener):
+        """Subscribe an async callable to this job's progress lines."""
+        self.requesters += 1
+        if listener is not None:
+            self.listeners.append(listener)
+
+    async def report(self, text: str):
+        """Send a progress line to every waiting requester."""
+        for listener in list(self.listeners):
+            try:
+                await listener(text)
+            except Exception:
+                pass
+
+    async def wait(self):
+        """Wait for the job to finish and return its result (or raise its error)."""
+        return await asyncio.shield(self.future)
+
+class DeployQueue:
+    """Single-writer queue of deploy jobs.
+
+    Jobs run one at a time, each in its own working directory. A request for a
+    branch that already has a job waiting to start joins that job instead of
+    queueing another publish, and receives the same result.
+    """
+
+    def __init__(self, runner):
+        # runner(branch, force, workdir, report) -> result
+        self.runner = runner
+        self._queue = asyncio.Queue()
+        self._pending = {}
+        self._waiting = []
+        self._ids = itertools.count(1)
+        self._worker = None
+        self.current_job = None
+
+    def start(self):
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._run_worker())
+
+    async def stop(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        for job in self._waiting:
+            if not job.future.done():
+                job.future.set_exception(Exception("Deploy was cancelled because the bot is shutting down"))
+        self._waiting.clear()
+        self._pending.clear()
+
+    def submit(self, branch: str, force: bool = False, listener=None) -> DeployJob:
+        """Queue a deploy of `branch`, or join the one already waiting for it."""
+        job = self._pending.get(branch)
+        if job is None:
+            job = DeployJob(next(self._ids), branch, force)
+            self._pending[branch] = job
+            self._waiting.append(job)
+            self._queue.put_nowait(job)
+        elif force:
+            job.force = True
+        job.add_listener(listener)
+        self.start()
+        return job
+
+    def position(self, job: DeployJob) -> int:
+        """Number of jobs that will run before `job` (0 if it is running or next)."""
+        if job not in self._waiting:
+            return 0
+        running = 1 if self.current_job is not None else 0
+        return running + self._waiting.index(job)
+
+    async def _run_worker(self):
+        while True:
+            job = await self._queue.get()
+            # From here on, new requests for this branch start a fresh job
+            if self._pending.get(job.branch) is job:
+                del self._pending[job.branch]
+            self._waiting.remove(job)
+            job.started = True
+            self.current_job = job
+            try:
+                result = await self.runner(job.branch, job.force, job.workdir, job.report)
+                if not job.future.done():
+                    job.future.set_result(result)
+            except asyncio.CancelledError:
+                if not job.future.done():
+                    job.future.set_exception(Exception("Deploy was cancelled because the bot is shutting down"))
+                raise
+            except Exception as e:
+                logger.error(f"Deploy job {job.job_id} ({job.branch}) failed: {e}")
+                if not job.future.done():
+                    job.future.set_exception(e)
+            finally:
+                self.current_job = None
+                shutil.rmtree(job.workdir, ignore_errors=True)
+                self._queue.task_done()
@@ -0,0 +1,88 @@
+import hashlib
+import json
+import os
+import time
+from config import Config
+
+# File types that Lune turns into ModuleScripts; other files never affect the place
+SYNCED_SUFFIXES = ('.json', '.lua', '.luau')
+
+def hash_file(path, chunk_size=1024 * 1024):
+    """Return the sha256 hex digest of a file, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def hash_data_files(data_root):
+    """Hash every synced data file under data_root.
+
+    Returns a dict of POSIX-style relative path -> sha256 hex digest.
+    """
+    hashes = {}
+    for dirpath, _, filenames in os.walk(data_root):
+        for filename in filenames:
+            if not filename.endswith(SYNCED_SUFFIXES):
+                continue
+            full_path = os.path.join(dirpath, filename)
+            relative_path = os.path.relpath(full_path, data_root).replace(os.sep, '/')
+            hashes[relative_path] = hash_file(full_path)
+    return hashes
+
+def diff_file_hashes(old_hashes, new_hashes):
+    """Compare two hash maps and return (changed, removed) relative paths.
+
+    `changed` covers both added and modified files.
+    """
+    old_hashes = old_hashes or {}
+    changed = sorted(path for path, digest in new_hashes.items() if old_hashes.get(path) != digest)
+    removed = sorted(path for path in old_hashes if path not in new_hashes)
+    return changed, removed
+
+class DeployStateStore:
+    """Persistent record of what was last published to each place.
+
+    Stored as a small JSON file outside TEMP_DIR so it survives cleanup and restarts.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or Config.DEPLOY_STATE_PATH
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            # A corrupt state file only costs one full deploy, never a failed one
+            return {}
+
+    def _save(self, state):
+        state_dir = os.path.dirname(self.path)
+        if state_dir:
+            os.makedirs(state_dir, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+    def get(self, place_id):
+        """Return the last deploy record for a place, or None if it was never deployed."""
+        return self._load().get(str(place_id))
+
+    def record(self, place_id, branch, commit_sha, file_hashes, data_root=None):
+        """Remember the commit and data file hashes that are now live on a place.
+
+        `data_root` is the repo-relative data folder the files were read from.
+        """
+        state = self._load()
+        state[str(place_id)] = {
+            'branch': branch,
+            'commit_sha': commit_sha,
+            'data_root': data_root,
+            'files': file_hashes,
+            'published_at': int(time.time())
+        }
+        self._save(state)
@@ -1,12 +1,20 @@
 import discord
 from discord.ext import commands
 import asyncio
+import hashlib
+import json
 import os
 import logging
 from typing import Optional
+from archive_cache import ArchiveCache, BlobCache, LuauModuleCache, PlaceCache
 from config import Config
+from data_validation import DataValidationError
+from deploy_queue import DeployQueue
+from deploy_state import DeployStateStore
 from github_client import GitHubClient
+from metrics import start_metrics_server, store as metrics_store
 from roblox_client import RobloxClient
+from sync_pipeline import SyncPipeline, SyncResult
 from discord import app_commands
 
 logger = logging.getLogger(__name__)
@@ -21,35 +29,124 @@ class SyncBot(commands.Bot):
         
         self.github_client = GitHubClient()
         self.roblox_client = RobloxClient()
+        self.deploy_state = DeployStateStore()
+        self.archive_cache = ArchiveCache()
+        self.blob_cache = BlobCache()
+        self.place_cache = PlaceCache() if Config.PLACE_CACHE_ENABLED else None
+        self.luau_cache = LuauModuleCache() if Config.COMPILE_JSON_TO_LUAU else None
+        self.pipeline = SyncPipeline(
+            self.github_client, self.roblox_client, self.deploy_state, self.archive_cache, self.blob_cache,
+            place_cache=self.place_cache, luau_cache=self.luau_cache
+        )
+        self.deploy_queue = DeployQueue(self.pipeline.run)
+        self.metrics_runner = None
+        self.webhook_runner = None
+        self.webhook_debouncer = None
     
     async def setup_hook(self):
         """Called when the bot is starting up"""
+        await metrics_store.load()
+        await self.github_client.start()
+        await self.roblox_client.start()
+        # Leftover job directories from a previous process are never resumed
+        self.roblox_client.cleanup_temp_files()
+        # Drops unfinished downloads that are too old to be worth resuming
+        self.archive_cache.evict()
+        self.blob_cache.evict()
+        self.deploy_queue.start()
+        if Config.METRICS_PORT:
+            try:
+                self.metrics_runner = await start_metrics_server()
+            except OSError as e:
+                logger.error(f"Could not start metrics server on port {Config.METRICS_PORT}: {e}")
+        if Config.WEBHOOK_PORT:
+            if not Config.WEBHOOK_SECRET:
+                logger.error("WEBHOOK_PORT is set but WEBHOOK_SECRET is empty; not starting the webhook listener")
+            else:
+                from webhook import start_webhook_server
+                try:
+                    self.webhook_runner, self.webhook_debouncer = await start_webhook_server(self.run_webhook_deploy)
+                except OSError as e:
+                    logger.error(f"Could not start webhook listener on port {Config.WEBHOOK_PORT}: {e}")
         try:
             guild_obj = discord.Object(id=Config.GUILD_ID) if (Config.GUILD_ID and Config.GUILD_ID > 0) else None
-            for cmd in list(self.tree.get_commands()):
-                if cmd.name == 'sync':
-                    try:
-                        self.tree.remove_command(cmd.name, guild=guild_obj)
-                    except Exception:
-                        pass
-            self.tree.add_command(app_commands.Command(
-                name='sync',
-                description='Sync latest changes from GitHub to Roblox',
-                callback=sync_command_handler
-            ), guild=guild_obj)
-
-            if guild_obj:
-                await self.tree.sync(guild=guild_obj)
-                guild_cmds = await self.tree.fetch_commands(guild=guild_obj)
-                logger.info(f"Slash commands synced to guild {Config.GUILD_ID}: {[c.name for c in guild_cmds]}")
+            commands_to_register = [
+                app_commands.Command(
+                    name='sync',
+                    description='Sync latest changes from GitHub to Roblox',
+                    callback=sync_command_handler
+                ),
+                app_commands.Command(
+                    name='sync-stats',
+                    description='Show p50/p95 timings of recent sync stages',
+                    callback=sync_stats_command_handler
+                ),
+            ]
+            for command in commands_to_register:
+                try:
+                    self.tree.remove_command(command.name, guild=guild_obj)
+                except Exception:
+                    pass
+                self.tree.add_command(command, guild=guild_obj)
+
+            scope = f"{self.application_id}:{Config.GUILD_ID if guild_obj else 'global'}"
+            tree_hash = self.command_tree_hash(guild_obj)
+            stored = self.load_command_tree_hashes()
+            if stored.get(scope) == tree_hash and not Config.FORCE_COMMAND_SYNC:
+                logger.info(f"Slash commands unchanged ({tree_hash[:12]}), skipping sync")
             else:
-                await self.tree.sync()
-                global_cmds = await self.tree.fetch_commands()
-                logger.info(f"Slash commands synced globally: {[c.name for c in global_cmds]}")
+                synced = await self.tree.sync(guild=guild_obj)
+                where = f"to guild {Config.GUILD_ID}" if guild_obj else "globally"
+                logger.info(f"Slash commands synced {where}: {[c.name for c in synced]}")
+                stored[scope] = tree_hash
+                self.save_command_tree_hashes(stored)
         except Exception as e:
             logger.error(f"Slash command registration/sync failed: {e}")
         logger.info("Bot setup complete")
     
+    def command_tree_hash(self, guild_obj) -> str:
+        """Hash the payload tree.sync would send, so an unchanged command set can skip the sync"""
+        payload = sorted(
+            (self._command_payload(command) for command in self.tree.get_commands(guild=guild_obj)),
+            key=lambda command: (command.get('type', 1), command['name'])
+        )
+        return hashlib.sha256(json.dumps(payload, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def _command_payload(self, command) -> dict:
+        try:
+            return command.to_dict(self.tree)
+        except TypeError:
+            # discord.py before 2.4 builds the payload without the tree
+            return command.to_dict()
+
+    def load_command_tree_hashes(self) -> dict:
+        try:
+            with open(Config.COMMAND_TREE_HASH_PATH, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def save_command_tree_hashes(self, hashes: dict):
+        os.makedirs(os.path.dirname(Config.COMMAND_TREE_HASH_PATH) or '.', exist_ok=True)
+        tmp_path = Config.COMMAND_TREE_HASH_PATH + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(hashes, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, Config.COMMAND_TREE_HASH_PATH)
+
+    async def close(self):
+        """Stop the webhook listener and deploy queue and close the pooled HTTP sessions before shutting down"""
+        if self.webhook_debouncer is not None:
+            self.webhook_debouncer.cancel()
+        if self.webhook_runner is not None:
+            await self.webhook_runner.cleanup()
+        await self.deploy_queue.stop()
+        await metrics_store.flush()
+        if self.metrics_runner is not None:
+            await self.metrics_runner.cleanup()
+        await self.github_client.close()
+        await self.roblox_client.close()
+        await super().close()
+    
     def has_permission(self, user: discord.Member) -> bool:
         """Check if user has permission to use sync command.
 
@@ -70,6 +167,45 @@ class SyncBot(commands.Bot):
 
         return False
     
+    async def run_webhook_deploy(self, branch: str, pushes: int):
+        """Deploy a branch after a burst of GitHub pushes and post the result to DEPLOY_CHANNEL_ID"""
+        channel = None
+        if Config.DEPLOY_CHANNEL_ID:
+            channel = self.get_channel(Config.DEPLOY_CHANNEL_ID)
+            if channel is None:
+                try:
+                    channel = await self.fetch_channel(Config.DEPLOY_CHANNEL_ID)
+                except discord.DiscordException as e:
+                    logger.error(f"Could not find deploy channel {Config.DEPLOY_CHANNEL_ID}: {e}")
+        status_msg = None
+        if channel is not None:
+            try:
+                status_msg = await channel.send(f"🔔 {pushes} push(es) to `{branch}`, starting automatic deploy...")
+            except discord.DiscordException as e:
+                logger.error(f"Could not post to deploy channel {Config.DEPLOY_CHANNEL_ID}: {e}")
+
+        async def update_status(text: str):
+            if status_msg is None:
+                return
+            try:
+                await status_msg.edit(content=text)
+            except Exception:
+                pass
+
+        logger.info(f"Automatic deploy of {branch} after {pushes} push(es)")
+        job = self.deploy_queue.submit(branch, False, update_status)
+        try:
+            result = await job.wait()
+            embed = build_result_embed(result)
+        except Exception as e:
+            logger.error(f"Automatic deploy of {branch} failed: {e}")
+            embed = build_error_embed(e)
+        if status_msg is not None:
+            try:
+                await status_msg.edit(content=None, embed=embed)
+            except Exception:
+                pass
+    
     async def on_ready(self):
         logger.info(f'{self.user} has connected to Discord!')
         logger.info(f'Bot is in {len(self.guilds)} guilds')
@@ -80,10 +216,87 @@ class SyncBot(commands.Bot):
         logger.error(f"Command error: {error}")
         await ctx.send(f"An error occurred: {str(error)}")
 
-bot = SyncBot()
+def build_result_embed(result: SyncResult) -> discord.Embed:
+    """Render a finished deploy as a Discord embed"""
+    commit_sha = result.commit_sha[:7]
+    if result.status == 'up_to_date':
+        return discord.Embed(
+            title="✅ Already Up To Date",
+            color=0x00ff00,
+            description=f"**Commit:** `{commit_sha}` is already published. Nothing to sync.\nUse `force` to publish anyway."
+        )
+    if result.status == 'no_changes':
+        return discord.Embed(
+            title="✅ No Data Changes",
+            color=0x00ff00,
+            description=f"**Commit:** `{commit_sha}`\n**Message:** {result.commit_message}\n\nNo data files changed since the last deploy. Skipped publishing."
+        )
+    partial = result.status == 'partial'
+    embed = discord.Embed(
+        title="⚠️ Sync Partially Completed" if partial else "✅ Sync Completed Successfully!",
+        color=0xffa500 if partial else 0x00ff00,
+        description=f"**Commit:** `{commit_sha}`\n**Message:** {result.commit_message}"
+    )
+    fetch_steps = "• Fetched changed data files" if result.used_delta else "• Downloaded repository\n• Extracted data files"
+    published = [target for target in result.targets if target.status == 'published']
+    place_step = "• Reused cached place file" if published and all(t.place_cached for t in published) else "• Downloaded place file"
+    embed.add_field(name="Steps Completed", value=f"• Fetched latest changes\n{fetch_steps}\n{place_step}\n• Synced with Lune\n• Published to Roblox", inline=False)
+    embed.add_field(name="Data Files", value=f"{len(result.changed_files)} changed, {len(result.removed_files)} removed, {result.total_files} total", inline=False)
+    if result.peak_memory_bytes or result.peak_disk_bytes:
+        embed.add_field(
+            name="Resources",
+            value=f"Peak memory {result.peak_memory_bytes / (1024 * 1024):.0f} MB · "
+                  f"scratch disk {result.peak_disk_bytes / (1024 * 1024):.0f} MB",
+            inline=False
+        )
+    module_counts = {}
+    for target in result.targets:
+        for key, value in target.modules.items():
+            module_counts[key] = module_counts.get(key, 0) + value
+    if module_counts:
+        embed.add_field(
+            name="ModuleScripts",
+            value=", ".join(f"{module_counts.get(key, 0)} {key}" for key in ('created', 'updated', 'skipped', 'removed')),
+            inline=False
+        )
+    if len(result.targets) > 1:
+        icons = {'published': '✅', 'up_to_date': '✅', 'no_changes': '✅', 'failed': '❌'}
+        labels = {'published': 'Published', 'up_to_date': 'Already up to date', 'no_changes': 'No data changes'}
+        for target in result.targets[:20]:
+            if target.status == 'failed':
+                value = f"Failed: {target.error}"[:1024]
+            else:
+                value = labels.get(target.status, target.status)
+                if target.status == 'published':
+                    value += f" · {target.changed_files} changed, {target.removed_files} removed"
+            embed.add_field(name=f"{icons.get(target.status, '•')} {target.name} ({target.place_id})", value=value, inline=False)
+    return embed
+
+def build_error_embed(error: Exception) -> discord.Embed:
+    """Render a failed deploy as a Discord embed"""
+    if isinstance(error, DataValidationError):
+        lines = []
+        length = 0
+        for line in error.errors:
+            if length + len(line) + 1 > 3500:
+                lines.append(f"... and {len(error.errors) - len(lines)} more")
+                break
+            lines.append(line)
+            length += len(line) + 1
+        return discord.Embed(
+            title="❌ Data Validation Failed",
+            color=0xff0000,
+            description=f"{len(error.errors)} problem(s) found in the data files. Nothing was published.\n```\n" + "\n".join(lines) + "\n```"
+        )
+    return discord.Embed(
+        title="❌ Sync Failed",
+        color=0xff0000,
+        description=f"An error occurred during sync: {str(error)}"
+    )
 
-async def sync_command_handler(interaction: discord.Interaction, branch: Optional[str] = None):
+async def sync_command_handler(interaction: discord.Interaction, branch: Optional[str] = None, force: bool = False):
     """Handle the /sync command"""
+    bot = interaction.client
     if not bot.has_permission(interaction.user):
         await interaction.response.send_message("❌ You don't have permission to use this command.", ephemeral=True)
         return
@@ -97,77 +310,62 @@ async def sync_command_handler(interaction: discord.Interaction, branch: Optiona
         except Exception:
             pass
 
+    branch_name = branch or bot.github_client.branch
+    job = bot.deploy_queue.submit(branch_name, force, update_status)
+    if job.requesters > 1:
+        await update_status(f"🔗 Joined the pending deploy of `{branch_name}` requested by someone else...")
+    elif bot.deploy_queue.position(job) > 0:
+        await update_status(f"⏳ Queued behind {bot.deploy_queue.position(job)} deploy(s)...")
+
     try:
-        await update_status(f"🔄 Fetching latest changes from GitHub... (branch: {branch or bot.github_client.branch})")
-        commit_info = await bot.github_client.get_latest_commit(branch)
-        commit_sha = commit_info['sha'][:7]
-        commit_message = commit_info['commit']['message']
-        
-        await update_status("📥 Downloading repository...")
-        zip_path = os.path.join(Config.TEMP_DIR, 'repo.zip')
-        await bot.github_client.download_repository(zip_path, branch)
-        
-        await update_status("📂 Extracting data files...")
-        repo_root = await bot.github_client.extract_data_files(zip_path, Config.DATA_FILES_DIR)
-
-        # Point Lune to the Rojo data root inside the repo
-        data_root = os.path.join(repo_root, 'AV Balancing', 'src', 'ReplicatedStorage', 'Modules', 'Data')
-        if os.path.exists(data_root):
-            bot.roblox_client.data_files_dir = data_root
-        else:
-            # Fallback: try monorepo-less structure
-            alt_root = os.path.join(repo_root, 'src', 'ReplicatedStorage', 'Modules', 'Data')
-            if os.path.exists(alt_root):
-                bot.roblox_client.data_files_dir = alt_root
-            else:
-                raise Exception(f"Data directory not found. Tried: {data_root} and {alt_root}")
-        
-        await update_status("🎮 Downloading current place file...")
-        await bot.roblox_client.download_place_file()
-        
-        await update_status("🔄 Syncing data files with Lune...")
-        await bot.roblox_client.sync_data_files()
-        
-        await update_status("🚀 Publishing to Roblox...")
-        await bot.roblox_client.publish_place()
-        
-        embed = discord.Embed(
-            title="✅ Sync Completed Successfully!",
-            color=0x00ff00,
-            description=f"**Commit:** `{commit_sha}`\n**Message:** {commit_message}"
-        )
-        embed.add_field(name="Steps Completed", value="• Fetched latest changes\n• Downloaded repository\n• Extracted data files\n• Downloaded place file\n• Synced with Lune\n• Published to Roblox", inline=False)
-        await status_msg.edit(content=None, embed=embed)
-        
-        bot.roblox_client.cleanup_temp_files()
-        
+        result = await job.wait()
+        await status_msg.edit(content=None, embed=build_result_embed(result))
     except Exception as e:
         logger.error(f"Sync error: {e}")
-        embed = discord.Embed(
-            title="❌ Sync Failed",
-            color=0xff0000,
-            description=f"An error occurred during sync: {str(e)}"
-        )
+        embed = build_error_embed(e)
         try:
             await status_msg.edit(content=None, embed=embed)
         except Exception:
             await interaction.followup.send(embed=embed)
-        
-        bot.roblox_client.cleanup_temp_files()
+
+async def sync_stats_command_handler(interaction: discord.Interaction):
+    """Handle the /sync-stats command"""
+    if not interaction.client.has_permission(interaction.user):
+        await interaction.response.send_message("❌ You don't have permission to use this command.", ephemeral=True)
+        return
+    summary = metrics_store.summary()
+    if not summary:
+        await interaction.response.send_message("No sync timings recorded yet. Run `/sync` first.", ephemeral=True)
+        return
+
+    def table(names, limit=1024):
+        """A code block of p50/p95 rows that fits an embed field, fences included."""
+        rows = [f"{'span':<34}{'n':>4}{'p50':>9}{'p95':>9}"]
+        for name in names:
+            stats = summary[name]
+            rows.append(f"{name:<34}{stats['count']:>4}{stats['p50']:>8.2f}s{stats['p95']:>8.2f}s")
+        body = "\n".join(rows)
+        fences = len("```\n") + len("\n```")
+        if len(body) + fences > limit:
+            # Cut whole rows, leaving room for the note, so the closing fence survives
+            body = body[:limit - fences - 16].rsplit("\n", 1)[0]
+            shown = body.count("\n")
+            body += f"\n... {len(names) - shown} more"
+        return "```\n" + body + "\n```"
+
+    stage_names = [name for name in summary if name.startswith('stage.')]
+    call_names = [name for name in summary if not name.startswith('stage.')]
+    embed = discord.Embed(title="📊 Sync Stage Timings", color=0x5865f2)
+    if stage_names:
+        embed.add_field(name="Pipeline stages", value=table(stage_names), inline=False)
+    if call_names:
+        embed.add_field(name="Client calls", value=table(call_names), inline=False)
+    transferred = {name: stats['bytes'] for name, stats in summary.items() if stats['bytes']}
+    if transferred:
+        lines = [f"{name}: {total / (1024 * 1024):.2f} MB" for name, total in transferred.items()]
+        embed.add_field(name="Data transferred (recent runs)", value="\n".join(lines)[:1024], inline=False)
+    await interaction.response.send_message(embed=embed)
 
 if __name__ == "__main__":
-    if not Config.DISCORD_TOKEN:
-        logger.error("DISCORD_TOKEN not found in environment variables")
-        exit(1)
-    
-    if not Config.GITHUB_TOKEN:
-        logger.error("GITHUB_TOKEN not found in environment variables")
-        exit(1)
-    
-    if not Config.ROBLOX_API_KEY:
-        logger.error("ROBLOX_API_KEY not found in environment variables")
-        exit(1)
-    
-    os.makedirs(Config.TEMP_DIR, exist_ok=True)
-    
-    bot.run(Config.DISCORD_TOKEN)
+    from main import main
+    main()
@@ -0,0 +1,224 @@
+import asyncio
+import logging
+import os
+import random
+import re
+import time
+import aiohttp
+from config import Config
+from metrics import add_bytes, set_attr
+from rate_limit import RateLimitError, RequestError, TransientError
+from resource_guard import ResourceLimitError
+
+logger = logging.getLogger(__name__)
+
+_CONTENT_RANGE = re.compile(r'bytes (\d+)-(\d+)/(\d+|\*)')
+
+# The ETag or Last-Modified of a partial download is kept in "<output_path>.validator"
+VALIDATOR_SUFFIX = '.validator'
+
+class ProgressReporter:
+    """Turn byte counts into at most one progress callback per `interval` seconds.
+
+    `callback(done, total, bytes_per_second)` runs as a background task, and
+    updates that arrive while the previous one is still being sent are dropped,
+    so a slow Discord edit never stalls the download.
+    """
+
+    def __init__(self, callback, interval=None):
+        self.callback = callback
+        self.interval = Config.DOWNLOAD_PROGRESS_INTERVAL if interval is None else interval
+        self.started = time.perf_counter()
+        self.offset = 0
+        self._last = 0.0
+        self._task = None
+
+    def begin(self, offset):
+        """Start measuring throughput for an attempt that starts at `offset` bytes."""
+        self.started = time.perf_counter()
+        self.offset = offset
+
+    def update(self, done, total):
+        now = time.perf_counter()
+        if self.callback is None or now - self._last < self.interval:
+            return
+        if self._task is not None and not self._task.done():
+            return
+        self._last = now
+        rate = (done - self.offset) / max(now - self.started, 1e-6)
+        self._task = asyncio.ensure_future(self.callback(done, total, rate))
+
+    async def finish(self):
+        if self._task is not None:
+            await asyncio.gather(self._task, return_exceptions=True)
+
+def _validator_of(headers):
+    """The value to send as If-Range: a strong ETag, else Last-Modified (weak ETags are not allowed)."""
+    etag = headers.get('ETag')
+    if etag and not etag.startswith('W/'):
+        return etag
+    return headers.get('Last-Modified')
+
+def _load_validator(output_path):
+    try:
+        with open(output_path + VALIDATOR_SUFFIX, 'r', encoding='utf-8') as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+def _save_validator(output_path, validator):
+    """Store the validator next to the partial file, or remove a stale one if there is none."""
+    path = output_path + VALIDATOR_SUFFIX
+    if validator:
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(validator)
+    elif os.path.exists(path):
+        os.remove(path)
+
+def _retry_delay(attempt, retry_after=None):
+    if retry_after is not None:
+        return retry_after
+    base = Config.DOWNLOAD_BACKOFF_SECONDS * (2 ** (attempt - 1))
+    return min(base, 30) * random.uniform(0.5, 1.0)
+
+async def download_file(session, url, output_path, headers=None, progress=None, retries=None, buffer_size=None,
+                        scheduler=None, max_bytes=None, error_prefix="Download failed"):
+    """Stream `url` to `output_path`, resuming a partial file with HTTP Range requests.
+
+    Writes go through an executor in `buffer_size` blocks instead of small writes on
+    the event loop. Connection errors, timeouts, 429 and 5xx responses are retried
+    with jittered exponential backoff, continuing from the bytes already on disk
+    when the server answers the Range request with 206 (otherwise it starts over).
+    A partial file is only resumed if the ETag or Last-Modified it was started
+    with is stored next to it; it is sent as If-Range, so a changed resource
+    comes back whole instead of being appended to the old bytes.
+    GitHub's rate-limit 403 is retried like a 429. Failures raise the rate_limit
+    errors with the message "<error_prefix>: <status>": RequestError for other
+    statuses, RateLimitError or TransientError once the retries are used up.
+    `progress(done, total, bytes_per_second)` is called through a ProgressReporter.
+    With a RequestScheduler, every attempt is paced by it and updates its rate-limit state.
+    A file larger than `max_bytes` raises ResourceLimitError (before writing, when the size
+    is known up front) and the partial file is removed, since it can never be completed.
+    Returns the size of the finished file.
+    """
+    retries = Config.DOWNLOAD_RETRIES if retries is None else retries
+    buffer_size = buffer_size or Config.DOWNLOAD_BUFFER_SIZE
+    loop = asyncio.get_running_loop()
+    reporter = ProgressReporter(progress)
+    output_dir = os.path.dirname(output_path)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    validator = _load_validator(output_path)
+    attempt = 0
+    try:
+        while True:
+            attempt += 1
+            offset = os.path.getsize(output_path) if os.path.exists(output_path) else 0
+            if offset and not validator:
+                # Without a validator the bytes on disk may be from another version of the resource
+                logger.info(f"Discarding {offset} bytes of {output_path}: no validator to resume with")
+                os.remove(output_path)
+                offset = 0
+            request_headers = dict(headers or {})
+            if offset:
+                request_headers['Range'] = f"bytes={offset}-"
+                # Only resume if the resource is unchanged since the bytes we already have
+                request_headers['If-Range'] = validator
+            retry_after = None
+            status = None
+            rate_limited = False
+            try:
+                if scheduler is not None:
+                    await scheduler.acquire()
+                async with session.get(url, headers=request_headers) as response:
+                    if scheduler is not None:
+                        scheduler.update(response.headers)
+                    if response.status == 416 and offset:
+                        match = re.match(r'bytes \*/(\d+)', response.headers.get('Content-Range', ''))
+                        if match and int(match.group(1)) == offset:
+                            _save_validator(output_path, None)
+                            return offset
+                        os.remove(output_path)
+                        continue
+                    status = response.status
+                    rate_limited = status == 429 or (
+                        status == 403 and response.headers.get('X-RateLimit-Remaining', '').strip() == '0'
+                    )
+                    if rate_limited or status >= 500:
+                        retry_after = response.headers.get('Retry-After')
+                        retry_after = float(retry_after) if retry_after and retry_after.isdigit() else None
+                        if scheduler is not None and rate_limited:
+                            scheduler.pause(retry_after or _retry_delay(attempt))
+                        raise aiohttp.ClientResponseError(
+                            response.request_info, response.history, status=status, message=f"HTTP {status}"
+                        )
+                    if status not in (200, 206):
+                        raise RequestError(f"{error_prefix}: {status}", status, url)
+
+                    total = None
+                    if response.status == 206:
+                        match = _CONTENT_RANGE.match(response.headers.get('Content-Range', ''))
+                        if not match or int(match.group(1)) != offset:
+                            raise RequestError(
+                                f"{error_prefix}: unexpected Content-Range {response.headers.get('Content-Range')}", status, url
+                            )
+                        total = int(match.group(3)) if match.group(3) != '*' else None
+                        mode = 'ab'
+                        set_attr('resumed_from', offset)
+                        logger.info(f"Resuming download of {url} at {offset} bytes")
+                    else:
+                        # Full body: the server ignored the Range header, the resource changed
+                        # (If-Range did not match) or there was nothing to resume
+                        offset = 0
+                        mode = 'wb'
+                        if response.content_length is not None:
+                            total = response.content_length
+                        validator = _validator_of(response.headers)
+                        await loop.run_in_executor(None, _save_validator, output_path, validator)
+                    if max_bytes is not None and total is not None and total > max_bytes:
+                        raise ResourceLimitError(
+                            f"Download of {total / (1024 * 1024):.0f} MB is over the {max_bytes / (1024 * 1024):.0f} MB scratch limit"
+                        )
+
+                    f = await loop.run_in_executor(None, open, output_path, mode)
+                    buffer = bytearray()
+                    try:
+                        done = offset
+                        reporter.begin(offset)
+                        async for chunk in response.content.iter_chunked(64 * 1024):
+                            buffer += chunk
+                            done += len(chunk)
+                            add_bytes(len(chunk))
+                            if max_bytes is not None and done > max_bytes:
+                                raise ResourceLimitError(f"Download is over the {max_bytes / (1024 * 1024):.0f} MB scratch limit")
+                            if len(buffer) >= buffer_size:
+                                await loop.run_in_executor(None, f.write, bytes(buffer))
+                                buffer.clear()
+                            reporter.update(done, total)
+                    finally:
+                        # Also on interruption, so the next attempt resumes from what was received
+                        if buffer:
+                            await loop.run_in_executor(None, f.write, bytes(buffer))
+                        await loop.run_in_executor(None, f.close)
+                    if total is not None and done != total:
+                        raise aiohttp.ClientPayloadError(f"Download ended at {done} of {total} bytes")
+                    await loop.run_in_executor(None, _save_validator, output_path, None)
+                    set_attr('attempts', attempt)
+                    return done
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if attempt > retries:
+                    if rate_limited:
+                        raise RateLimitError(f"{error_prefix}: {status} (rate limited)", status, url, retry_after)
+                    if status is not None and status >= 500:
+                        raise TransientError(f"{error_prefix}: {status}", status, url)
+                    raise TransientError(f"{error_prefix}: {e or type(e).__name__}", url=url)
+                delay = _retry_delay(attempt, retry_after)
+                logger.warning(f"Download of {url} interrupted ({e or type(e).__name__}), retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+    except ResourceLimitError:
+        if os.path.exists(output_path):
+            os.remove(output_path)
+        _save_validator(output_path, None)
+        raise
+    finally:
+        await reporter.finish()
@@ -1,96 +1,313 @@
-import aiohttp
 import asyncio
+import base64
 import os
+import posixpath
+import shutil
 import zipfile
 from config import Config
+from downloader import download_file
+from http_session import create_session
+from metrics import add_bytes, timed
+from rate_limit import RequestScheduler
+from resource_guard import ResourceLimitError
+
+# Asks GitHub for file and blob bytes as-is instead of base64 inside JSON
+RAW_MEDIA_TYPE = "application/vnd.github.raw+json"
 
 class GitHubClient:
     def __init__(self):
         self.token = Config.GITHUB_TOKEN
         self.repo = Config.GITHUB_REPO
         self.branch = Config.GITHUB_BRANCH
-        self.base_url = f"https://api.github.com/repos/{self.repo}"
+        self.base_url = f"{Config.GITHUB_API_URL}/repos/{self.repo}"
         self.headers = {
             "Authorization": f"token {self.token}",
             "Accept": "application/vnd.github.v3+json"
         }
+        self.session = None
+        # url -> (ETag, parsed body) for conditional requests
+        self._etag_cache = {}
+        # Shared by every request so concurrent syncs respect one GitHub quota
+        self.scheduler = RequestScheduler(
+            'GitHub', Config.GITHUB_REQUESTS_PER_MINUTE, capacity=Config.GITHUB_REQUESTS_PER_MINUTE
+        )
+    
+    async def start(self):
+        """Open the shared HTTP session used by every request of this client."""
+        if self.session is None or self.session.closed:
+            self.session = create_session()
+    
+    async def close(self):
+        """Close the shared HTTP session and its pooled connections."""
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
+        self.session = None
     
+    async def _get_session(self):
+        if self.session is None or self.session.closed:
+            await self.start()
+        return self.session
+    
+    @timed('github.get_latest_commit')
     async def get_latest_commit(self, branch: str = None):
         """Get the latest commit from the specified branch.
 
         If branch is not provided, uses the default branch from config.
+        Repeated lookups send If-None-Match, so an unchanged branch costs a 304
+        that does not count against the GitHub rate limit.
         """
-        async with aiohttp.ClientSession() as session:
-            branch_to_use = branch or self.branch
-            url = f"{self.base_url}/commits/{branch_to_use}"
-            async with session.get(url, headers=self.headers) as response:
-                if response.status == 200:
-                    return await response.json()
-                else:
-                    raise Exception(f"Failed to get latest commit: {response.status}")
+        session = await self._get_session()
+        branch_to_use = branch or self.branch
+        url = f"{self.base_url}/commits/{branch_to_use}"
+        headers = dict(self.headers)
+        cached = self._etag_cache.get(url)
+        if cached:
+            headers["If-None-Match"] = cached[0]
+        ok_statuses = (200, 304) if cached else (200,)
+        async with self.scheduler.request(session, 'GET', url, "Failed to get latest commit",
+                                          ok_statuses, headers=headers) as response:
+            if response.status == 304:
+                return cached[1]
+            data = await response.json()
+            etag = response.headers.get("ETag")
+            if etag:
+                self._etag_cache[url] = (etag, data)
+            return data
     
-    async def download_repository(self, output_path, branch: str = None):
+    @timed('github.download_repository')
+    async def download_repository(self, output_path, branch: str = None, progress=None, max_bytes=None):
         """Download the repository as a ZIP file for the given branch.
 
         If branch is not provided, uses the default branch from config.
+        Any git ref works here, including a full commit SHA. A partial file left
+        at `output_path` by an earlier attempt is resumed where the server allows
+        it; `progress(done, total, bytes_per_second)` receives throttled updates.
+        An archive larger than `max_bytes` raises ResourceLimitError; HTTP failures
+        raise the rate_limit errors (RateLimitError, TransientError, RequestError).
         """
-        async with aiohttp.ClientSession() as session:
-            branch_to_use = branch or self.branch
-            url = f"{self.base_url}/zipball/{branch_to_use}"
-            async with session.get(url, headers=self.headers) as response:
-                if response.status == 200:
-                    output_dir = os.path.dirname(output_path)
-                    if output_dir:
-                        os.makedirs(output_dir, exist_ok=True)
-                    with open(output_path, 'wb') as f:
-                        async for chunk in response.content.iter_chunked(8192):
-                            f.write(chunk)
-                    return True
-                else:
-                    raise Exception(f"Failed to download repository: {response.status}")
+        session = await self._get_session()
+        branch_to_use = branch or self.branch
+        url = f"{self.base_url}/zipball/{branch_to_use}"
+        await download_file(session, url, output_path, headers=self.headers, progress=progress,
+                            scheduler=self.scheduler, max_bytes=max_bytes,
+                            error_prefix="Failed to download repository")
+        return True
     
-    async def extract_data_files(self, zip_path, extract_to):
+    @timed('github.verify_archive')
+    async def verify_archive(self, zip_path):
+        """Check the CRC of every member of a downloaded archive in a worker thread.
+
+        Returns False for a truncated or corrupt zip, which must not be cached.
+        """
+        return await asyncio.get_running_loop().run_in_executor(None, self._archive_ok, zip_path)
+
+    @staticmethod
+    def _archive_ok(zip_path):
+        try:
+            with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+                return zip_ref.testzip() is None
+        except (zipfile.BadZipFile, EOFError, OSError):
+            return False
+
+    @timed('github.extract_data_files')
+    async def extract_data_files(self, zip_path, extract_to, prefixes=None, max_bytes=None):
         """Extract repository files needed for data sync.
 
+        Only data files whose repo-relative path starts with one of `prefixes`
+        (all data files if None) are extracted. Each member is streamed straight
+        to its final path in a worker thread, keeping the event loop free.
+        If the selected files add up to more than `max_bytes`, ResourceLimitError is
+        raised before anything is written.
         Returns the extraction root directory (path under which repo content resides).
         """
+        loop = asyncio.get_running_loop()
+        extracted_bytes = await loop.run_in_executor(None, self._extract_members, zip_path, extract_to, prefixes,
+                                                     max_bytes)
+        add_bytes(extracted_bytes)
+        return extract_to
+
+    @staticmethod
+    def _extract_members(zip_path, extract_to, prefixes, max_bytes=None):
+        """Extract matching members and return the number of bytes written."""
+        extracted_bytes = 0
         os.makedirs(extract_to, exist_ok=True)
+        extract_root = os.path.abspath(extract_to)
+        data_suffixes = ('.json', '.lua', '.luau', '.txt', '.csv')
+        if prefixes:
+            prefixes = tuple(prefix.strip('/') + '/' for prefix in prefixes)
 
         with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-            members = zip_ref.namelist()
-            root_dir = members[0] if members else ""
-
-            data_suffixes = ('.json', '.lua', '.luau', '.txt', '.csv')
-
-            for member in members:
-                if member.endswith('/'):
-                    continue
-                if not member.endswith(data_suffixes):
+            infos = zip_ref.infolist()
+            # GitHub zipballs wrap everything in a single "<owner>-<repo>-<sha>/" folder
+            first = infos[0].filename if infos else ""
+            root_dir = first.split('/', 1)[0] + '/' if '/' in first else ""
+            selected = []
+            for info in infos:
+                member = info.filename
+                if info.is_dir() or not member.endswith(data_suffixes):
                     continue
                 relative_path = member[len(root_dir):] if member.startswith(root_dir) else member
-                if not relative_path:
+                relative_path = posixpath.normpath(relative_path) if relative_path else ""
+                if not relative_path or relative_path.startswith(('..', '/')):
+                    continue
+                if prefixes and not relative_path.startswith(prefixes):
+                    continue
+                target_path = os.path.abspath(os.path.join(extract_root, relative_path))
+                if not target_path.startswith(extract_root + os.sep):
                     continue
-                zip_ref.extract(member, extract_to)
-                old_path = os.path.join(extract_to, member)
-                new_path = os.path.join(extract_to, relative_path)
-                if old_path != new_path:
-                    os.makedirs(os.path.dirname(new_path), exist_ok=True)
-                    os.rename(old_path, new_path)
-                    try:
-                        os.rmdir(os.path.dirname(old_path))
-                    except OSError:
-                        pass
+                selected.append((info, target_path))
 
-        return extract_to
+            total_bytes = sum(info.file_size for info, _ in selected)
+            if max_bytes is not None and total_bytes > max_bytes:
+                raise ResourceLimitError(
+                    f"Extracting {total_bytes / (1024 * 1024):.0f} MB of data files is over the "
+                    f"{max_bytes / (1024 * 1024):.0f} MB scratch limit"
+                )
+
+            created_dirs = set()
+            for info, target_path in selected:
+                target_dir = os.path.dirname(target_path)
+                if target_dir not in created_dirs:
+                    os.makedirs(target_dir, exist_ok=True)
+                    created_dirs.add(target_dir)
+                with zip_ref.open(info) as source, open(target_path, 'wb') as target:
+                    shutil.copyfileobj(source, target, 1024 * 1024)
+                extracted_bytes += info.file_size
+
+        return extracted_bytes
     
-    async def get_file_contents(self, file_path):
+    @timed('github.get_file_contents')
+    async def get_file_contents(self, file_path, ref: str = None):
         """Get the contents of a specific file from the repository"""
-        async with aiohttp.ClientSession() as session:
-            url = f"{self.base_url}/contents/{file_path}"
-            async with session.get(url, headers=self.headers) as response:
-                if response.status == 200:
+        session = await self._get_session()
+        url = f"{self.base_url}/contents/{file_path}"
+        params = {"ref": ref} if ref else None
+        headers = {**self.headers, "Accept": RAW_MEDIA_TYPE}
+        async with self.scheduler.request(session, 'GET', url, "Failed to get file contents",
+                                          headers=headers, params=params) as response:
+            if response.content_type == 'application/json':
+                return self._decode_content(await response.json()).decode('utf-8')
+            return (await response.read()).decode('utf-8')
+    
+    @timed('github.download_blob')
+    async def download_blob(self, blob_sha, output_path):
+        """Stream the bytes of a git blob to `output_path` and return their size.
+
+        The blob is requested in the raw media type and written as it arrives; a
+        server that answers with the base64 JSON form is decoded a slice at a time.
+        """
+        session = await self._get_session()
+        loop = asyncio.get_running_loop()
+        url = f"{self.base_url}/git/blobs/{blob_sha}"
+        headers = {**self.headers, "Accept": RAW_MEDIA_TYPE}
+        async with self.scheduler.request(session, 'GET', url, f"Failed to get blob {blob_sha[:7]}",
+                                          headers=headers) as response:
+            f = await loop.run_in_executor(None, self._open_for_write, output_path)
+            try:
+                if response.content_type == 'application/json':
                     data = await response.json()
-                    import base64
-                    return base64.b64decode(data['content']).decode('utf-8')
+                    if data.get('encoding', 'base64') != 'base64':
+                        await loop.run_in_executor(None, f.write, data['content'].encode('utf-8'))
+                    else:
+                        await loop.run_in_executor(None, self._write_base64, data['content'], f)
                 else:
-                    raise Exception(f"Failed to get file contents: {response.status}")
+                    async for chunk in response.content.iter_chunked(256 * 1024):
+                        await loop.run_in_executor(None, f.write, chunk)
+            finally:
+                await loop.run_in_executor(None, f.close)
+        size = os.path.getsize(output_path)
+        add_bytes(size)
+        return size
+    
+    @staticmethod
+    def _decode_content(data):
+        if data.get('encoding', 'base64') != 'base64':
+            return data['content'].encode('utf-8')
+        return base64.b64decode(data['content'])
+
+    @staticmethod
+    def _write_base64(text, f, chunk_size=1024 * 1024):
+        """Decode base64 `text` into the file `f` one slice at a time (GitHub wraps it in lines)."""
+        pending = ''
+        for start in range(0, len(text), chunk_size):
+            piece = pending + ''.join(text[start:start + chunk_size].split())
+            usable = len(piece) - len(piece) % 4
+            f.write(base64.b64decode(piece[:usable]))
+            pending = piece[usable:]
+        if pending:
+            f.write(base64.b64decode(pending))
+
+    @staticmethod
+    def _open_for_write(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return open(path, 'wb')
+    
+    @timed('github.compare_commits')
+    async def compare_commits(self, base_sha, head_sha):
+        """Compare two commits and return GitHub's comparison (status and changed files)"""
+        session = await self._get_session()
+        url = f"{self.base_url}/compare/{base_sha}...{head_sha}"
+        async with self.scheduler.request(session, 'GET', url, "Failed to compare commits",
+                                          headers=self.headers) as response:
+            return await response.json()
+    
+    @timed('github.fetch_changed_data_files')
+    async def fetch_changed_data_files(self, base_sha, head_sha, data_root, output_dir, blob_cache=None):
+        """Fetch only the data files that changed between two commits.
+
+        Changed blobs under the repo-relative `data_root` are written to `output_dir`
+        (mirroring their path below data_root), fetched concurrently and served from
+        `blob_cache` when possible. Returns (changed, removed) lists of paths relative
+        to data_root, or None when the diff cannot be used and the caller should fall
+        back to the full zipball (diverged history, truncated or oversized diff).
+        """
+        comparison = await self.compare_commits(base_sha, head_sha)
+        # For diverged/behind comparisons the file list is relative to the merge base,
+        # not to base_sha, so it does not describe what is live
+        if comparison.get('status') not in ('ahead', 'identical'):
+            return None
+        files = comparison.get('files') or []
+        # The compare API lists at most 300 files; a full list there may be truncated
+        if len(files) >= 300 or len(files) > Config.DELTA_MAX_FILES:
+            return None
+
+        prefix = data_root.strip('/') + '/'
+        data_suffixes = ('.json', '.lua', '.luau', '.txt', '.csv')
+        to_fetch = {}
+        removed = set()
+        for entry in files:
+            filename = entry.get('filename', '')
+            previous = entry.get('previous_filename')
+            if previous and previous.startswith(prefix) and previous.endswith(data_suffixes):
+                removed.add(previous[len(prefix):])
+            if not filename.startswith(prefix) or not filename.endswith(data_suffixes):
+                continue
+            relative_path = filename[len(prefix):]
+            if entry.get('status') == 'removed':
+                removed.add(relative_path)
+            elif not entry.get('sha'):
+                return None
+            else:
+                to_fetch[relative_path] = entry['sha']
+        removed -= set(to_fetch)
+
+        os.makedirs(output_dir, exist_ok=True)
+        output_root = os.path.abspath(output_dir)
+        semaphore = asyncio.Semaphore(Config.DELTA_CONCURRENCY)
+        loop = asyncio.get_running_loop()
+
+        async def fetch(relative_path, blob_sha):
+            target_path = os.path.abspath(os.path.join(output_root, *relative_path.split('/')))
+            if not target_path.startswith(output_root + os.sep):
+                raise Exception(f"Refusing to write outside the data directory: {relative_path}")
+            if blob_cache and await loop.run_in_executor(None, blob_cache.copy_to, blob_sha, target_path):
+                return
+            async with semaphore:
+                await self.download_blob(blob_sha, target_path)
+            if blob_cache:
+                await loop.run_in_executor(None, blob_cache.add_file, blob_sha, target_path)
+
+        await asyncio.gather(*(fetch(path, sha) for path, sha in to_fetch.items()))
+        if blob_cache:
+            await loop.run_in_executor(None, blob_cache.evict)
+        return sorted(to_fetch), sorted(removed)
@@ -0,0 +1,21 @@
+import aiohttp
+from config import Config
+
+def create_session():
+    """Create a long-lived aiohttp session with a bounded, keep-alive connection pool.
+
+    DNS lookups are cached and connections are kept open between requests, so
+    back-to-back syncs reuse warm TCP+TLS connections instead of handshaking again.
+    """
+    connector = aiohttp.TCPConnector(
+        limit=Config.HTTP_POOL_SIZE,
+        limit_per_host=Config.HTTP_POOL_SIZE_PER_HOST,
+        ttl_dns_cache=Config.HTTP_DNS_CACHE_TTL,
+        keepalive_timeout=Config.HTTP_KEEPALIVE_TIMEOUT
+    )
+    timeout = aiohttp.ClientTimeout(
+        total=None,
+        connect=Config.HTTP_CONNECT_TIMEOUT,
+        sock_read=Config.HTTP_READ_TIMEOUT
+    )
+    return aiohttp.ClientSession(connector=connector, timeout=timeout)
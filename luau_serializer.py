@@ -0,0 +1,107 @@
+import json
+import math
+import os
+import re
+
+# Bump when the generated source changes so cached modules and SyncHash values are refreshed
+SERIALIZER_VERSION = 1
+
+_IDENTIFIER = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+_LUAU_KEYWORDS = {
+    'and', 'break', 'do', 'else', 'elseif', 'end', 'false', 'for', 'function', 'if', 'in',
+    'local', 'nil', 'not', 'or', 'repeat', 'return', 'then', 'true', 'until', 'while',
+    'continue', 'export', 'type', 'typeof',
+}
+_ESCAPES = {'\\': '\\\\', '"': '\\"', '\n': '\\n', '\r': '\\r', '\t': '\\t'}
+
+def _string_literal(value):
+    out = []
+    for char in value:
+        if char in _ESCAPES:
+            out.append(_ESCAPES[char])
+        elif ord(char) < 32 or ord(char) == 127:
+            out.append(f"\\{ord(char):03d}")
+        else:
+            out.append(char)
+    return '"' + ''.join(out) + '"'
+
+def _number_literal(value):
+    if isinstance(value, float):
+        if not math.isfinite(value):
+            raise ValueError(f"{value} cannot be written as a Luau literal")
+        if value.is_integer() and abs(value) < 2 ** 53:
+            return str(int(value))
+        return repr(value)
+    return str(value)
+
+def _key_literal(key):
+    if _IDENTIFIER.match(key) and key not in _LUAU_KEYWORDS:
+        return key
+    return '[' + _string_literal(key) + ']'
+
+def to_luau(value, path='$'):
+    """Serialize a decoded JSON value as a compact Luau expression.
+
+    Objects become `{key=value,...}` with sorted keys, arrays become `{v1,v2,...}`,
+    and JSON null becomes nil (an object key holding null is left out, which reads
+    the same in Luau). Output is deterministic for equal input.
+    A null inside an array raises ValueError: Luau has no way to keep it, and the
+    resulting hole breaks `#` and `ipairs` on the array.
+    """
+    if value is None:
+        return 'nil'
+    if value is True:
+        return 'true'
+    if value is False:
+        return 'false'
+    if isinstance(value, (int, float)):
+        return _number_literal(value)
+    if isinstance(value, str):
+        return _string_literal(value)
+    if isinstance(value, list):
+        items = []
+        for index, item in enumerate(value):
+            if item is None:
+                raise ValueError(f"{path}[{index}] is null; a Luau array cannot hold nil")
+            items.append(to_luau(item, f"{path}[{index}]"))
+        return '{' + ','.join(items) + '}'
+    if isinstance(value, dict):
+        return '{' + ','.join(
+            f"{_key_literal(key)}={to_luau(value[key], f'{path}.{key}')}" for key in sorted(value) if value[key] is not None
+        ) + '}'
+    raise TypeError(f"Cannot serialize {type(value).__name__} to Luau")
+
+def _reject_constant(name):
+    raise ValueError(f"{name} is not valid JSON")
+
+def compile_json(text):
+    """Turn JSON text into ModuleScript source."""
+    return 'return ' + to_luau(json.loads(text, parse_constant=_reject_constant)) + '\n'
+
+def compile_json_files(data_root, file_hashes, paths, cache):
+    """Compile the JSON files among `paths` into cached Luau modules.
+
+    `file_hashes` maps relative paths to the sha256 of the JSON source, which (with
+    SERIALIZER_VERSION) keys the cache, so unchanged files are never converted twice.
+    Returns {relative path: (cache key, compiled module path)}.
+    """
+    # Evict up front so nothing compiled for this run disappears before Lune reads it
+    cache.evict()
+    compiled = {}
+    for relative_path in paths:
+        if not relative_path.endswith('.json'):
+            continue
+        key = f"{file_hashes[relative_path]}-v{SERIALIZER_VERSION}"
+        path = cache.get(key)
+        if path is None:
+            with open(os.path.join(data_root, *relative_path.split('/')), 'r', encoding='utf-8') as f:
+                try:
+                    source = compile_json(f.read())
+                except ValueError as e:
+                    raise Exception(f"Could not compile {relative_path} to Luau: {e}")
+            partial_path = cache.partial_path_for(key)
+            with open(partial_path, 'w', encoding='utf-8', newline='\n') as f:
+                f.write(source)
+            path = cache.put(key, partial_path, evict=False)
+        compiled[relative_path] = (key, path)
+    return compiled
@@ -0,0 +1,145 @@
+import asyncio
+import itertools
+import json
+import logging
+import os
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+class LuneWorker:
+    """Long-lived `lune run lune_sync.luau --worker` process.
+
+    Requests and responses are single JSON lines on the worker's stdin/stdout;
+    its stderr is streamed to the log. The worker keeps the last loaded place in
+    memory, so a sync against the place it saved last time skips `game:Load`.
+    Requests are sent one at a time. If the process dies or stops answering it is
+    killed and started again on the next request.
+    """
+
+    def __init__(self, script_path=None, timeout=None, start_timeout=None):
+        self.script_path = script_path or Config.LUNE_SCRIPT_PATH
+        self.timeout = timeout or Config.LUNE_TIMEOUT
+        self.start_timeout = start_timeout or Config.LUNE_WORKER_START_TIMEOUT
+        self.process = None
+        self.restarts = 0
+        self._stderr_task = None
+        self._lock = asyncio.Lock()
+        self._ids = itertools.count(1)
+
+    @property
+    def running(self):
+        return self.process is not None and self.process.returncode is None
+
+    async def _start(self):
+        if not os.path.exists(self.script_path):
+            raise Exception(f"Lune script not found at {self.script_path}")
+        try:
+            self.process = await asyncio.create_subprocess_exec(
+                "lune", "run", self.script_path, "--worker",
+                stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                limit=1024 * 1024
+            )
+        except FileNotFoundError:
+            raise Exception("lune not found. Please install: cargo install lune")
+        self._stderr_task = asyncio.ensure_future(self._pump_stderr(self.process.stderr))
+        try:
+            ready = await asyncio.wait_for(self._read_message(), timeout=self.start_timeout)
+        except asyncio.TimeoutError:
+            await self._kill()
+            raise Exception(f"Lune worker did not start within {self.start_timeout}s")
+        except BaseException:
+            await self._kill()
+            raise
+        if ready.get('event') != 'ready':
+            await self._kill()
+            raise Exception(f"Lune worker sent an unexpected greeting: {ready}")
+        logger.info(f"Lune worker started (pid {self.process.pid})")
+
+    async def _pump_stderr(self, stream):
+        async for raw_line in stream:
+            line = raw_line.decode('utf-8', errors='replace').rstrip()
+            if line:
+                logger.info(f"[lune-worker] {line}")
+
+    async def _read_message(self):
+        while True:
+            raw_line = await self.process.stdout.readline()
+            if not raw_line:
+                await self.process.wait()
+                raise Exception(f"Lune worker exited with code {self.process.returncode}")
+            try:
+                message = json.loads(raw_line)
+            except ValueError:
+                message = None
+            if isinstance(message, dict):
+                return message
+            logger.info(f"[lune-worker] {raw_line.decode('utf-8', errors='replace').rstrip()}")
+
+    async def _kill(self):
+        process = self.process
+        if process is None:
+            return
+        if process.returncode is None:
+            try:
+                process.kill()
+            except ProcessLookupError:
+                pass
+            await process.wait()
+        if self._stderr_task is not None:
+            await asyncio.gather(self._stderr_task, return_exceptions=True)
+            self._stderr_task = None
+        self.process = None
+
+    async def _send(self, payload):
+        if not self.running:
+            if self.process is not None:
+                logger.warning(f"Lune worker exited with code {self.process.returncode}, restarting it")
+                self.restarts += 1
+                await self._kill()
+            await self._start()
+        request_id = next(self._ids)
+        self.process.stdin.write((json.dumps({'id': request_id, **payload}) + '\n').encode('utf-8'))
+        await self.process.stdin.drain()
+        while True:
+            message = await self._read_message()
+            if message.get('id') == request_id:
+                return message
+
+    async def request(self, payload):
+        """Send one request and return the worker's response.
+
+        A worker that crashes before answering is restarted and the request retried
+        once; a timeout kills the worker and raises.
+        """
+        async with self._lock:
+            for attempt in (1, 2):
+                try:
+                    return await asyncio.wait_for(self._send(payload), timeout=self.timeout)
+                except asyncio.TimeoutError:
+                    await self._kill()
+                    raise Exception(f"Lune worker timed out after {self.timeout}s")
+                except asyncio.CancelledError:
+                    await self._kill()
+                    raise
+                except Exception as e:
+                    was_running = self.process is not None
+                    await self._kill()
+                    if attempt == 2 or not was_running:
+                        raise
+                    logger.warning(f"Lune worker failed ({e}), restarting it and retrying")
+                    self.restarts += 1
+
+    async def stop(self):
+        """Ask the worker to exit, killing it if it does not."""
+        async with self._lock:
+            if self.running:
+                try:
+                    self.process.stdin.write(b'{"op": "shutdown"}\n')
+                    await self.process.stdin.drain()
+                    await asyncio.wait_for(self.process.wait(), timeout=5)
+                except (asyncio.TimeoutError, ConnectionError):
+                    pass
+            await self._kill()
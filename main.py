@@ -1,7 +1,6 @@
 import logging
 import sys
 import os
-from discord_bot import SyncBot
 from config import Config
 
 def main():
@@ -18,11 +17,16 @@ def main():
     logger = logging.getLogger(__name__)
     logger.info("Starting Roblox Deploy Bot...")
     
+    for name in ('DISCORD_TOKEN', 'GITHUB_TOKEN', 'ROBLOX_API_KEY'):
+        if not getattr(Config, name):
+            logger.error(f"{name} is missing. Check your .env file.")
+            sys.exit(1)
+    os.makedirs(Config.TEMP_DIR, exist_ok=True)
+
     try:
+        # discord.py and the clients are only imported once the configuration is known to be usable
+        from discord_bot import SyncBot
         bot = SyncBot()
-        if not Config.DISCORD_TOKEN:
-            logger.error("DISCORD_TOKEN is missing. Check your .env file.")
-            sys.exit(1)
         bot.run(Config.DISCORD_TOKEN)
     except KeyboardInterrupt:
         logger.info("Bot stopped by user")
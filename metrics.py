@@ -0,0 +1,252 @@
+import asyncio
+import contextvars
+import functools
+import json
+import logging
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+_current_span = contextvars.ContextVar('current_span', default=None)
+
+class Span:
+    """Timing of one stage or client call."""
+
+    def __init__(self, name, attrs=None):
+        self.name = name
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        self.duration = 0.0
+        self.bytes = 0
+        self.status = 'ok'
+        self.attrs = dict(attrs or {})
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'ts': round(self.started_at, 3),
+            'duration': round(self.duration, 4),
+            'bytes': self.bytes,
+            'status': self.status,
+            **self.attrs
+        }
+
+def _percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * (len(sorted_values) - 1)))))
+    return sorted_values[index]
+
+class MetricsStore:
+    """Rolling store of recent spans per name, persisted as JSON lines.
+
+    Only the newest `max_samples` spans of each name are kept, both in memory and
+    (after periodic compaction) in the file, so it never grows without bound.
+    Inside an event loop, finished spans are written in batches from a worker
+    thread, so timing a stage adds no blocking disk I/O to it.
+    """
+
+    def __init__(self, path=None, max_samples=None):
+        self.path = path or Config.METRICS_PATH
+        self.max_samples = max_samples or Config.METRICS_MAX_SAMPLES
+        self._samples = None
+        self._lines_written = 0
+        self._pending = []
+        self._flush_task = None
+
+    async def load(self):
+        """Read the metrics file in a worker thread (at startup, before spans are recorded)."""
+        await asyncio.get_running_loop().run_in_executor(None, self._load)
+
+    def _load(self):
+        if self._samples is not None:
+            return self._samples
+        self._samples = {}
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    for line in f:
+                        try:
+                            sample = json.loads(line)
+                        except ValueError:
+                            continue
+                        self._bucket(sample['name']).append(sample)
+                        self._lines_written += 1
+            except OSError as e:
+                logger.warning(f"Could not read metrics file {self.path}: {e}")
+        return self._samples
+
+    def _bucket(self, name):
+        if name not in self._samples:
+            self._samples[name] = deque(maxlen=self.max_samples)
+        return self._samples[name]
+
+    def record(self, span: Span):
+        """Add a finished span and queue it for the metrics file."""
+        self._load()
+        sample = span.to_dict()
+        self._bucket(span.name).append(sample)
+        self._pending.append(sample)
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # No event loop to keep free (scripts): write straight away
+            self._write(*self._take_pending())
+            return
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = loop.create_task(self._flush())
+
+    async def flush(self):
+        """Wait until every recorded span is in the metrics file."""
+        while self._flush_task is not None and not self._flush_task.done():
+            await asyncio.shield(self._flush_task)
+
+    async def _flush(self):
+        loop = asyncio.get_running_loop()
+        while self._pending:
+            # Spans recorded while a batch is being written go out with the next one
+            await loop.run_in_executor(None, self._write, *self._take_pending())
+
+    def _take_pending(self):
+        """Return the pending batch, plus every kept sample if the file is due for compaction."""
+        batch, self._pending = self._pending, []
+        snapshot = None
+        if self._lines_written + len(batch) > 2 * self.max_samples * max(1, len(self._samples)):
+            # Copied here, on the loop, since spans keep being added while the thread writes
+            snapshot = [sample for bucket in self._samples.values() for sample in bucket]
+        return batch, snapshot
+
+    def _write(self, batch, snapshot=None):
+        try:
+            metrics_dir = os.path.dirname(self.path)
+            if metrics_dir:
+                os.makedirs(metrics_dir, exist_ok=True)
+            if snapshot is not None:
+                self._compact(snapshot)
+            else:
+                with open(self.path, 'a', encoding='utf-8') as f:
+                    f.write(''.join(json.dumps(sample) + '\n' for sample in batch))
+                self._lines_written += len(batch)
+        except OSError as e:
+            logger.warning(f"Could not write metrics file {self.path}: {e}")
+
+    def _compact(self, samples):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for sample in samples:
+                f.write(json.dumps(sample) + '\n')
+        os.replace(tmp_path, self.path)
+        self._lines_written = len(samples)
+
+    @asynccontextmanager
+    async def span(self, name, **attrs):
+        """Time the enclosed block and record it, even when it fails or is cancelled."""
+        span = Span(name, attrs)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except asyncio.CancelledError:
+            span.status = 'cancelled'
+            raise
+        except BaseException:
+            # Callers may have already classified the failure (e.g. 'skipped')
+            if span.status == 'ok':
+                span.status = 'error'
+            raise
+        finally:
+            _current_span.reset(token)
+            span.duration = time.perf_counter() - span._start
+            self.record(span)
+
+    def summary(self, prefix=None):
+        """Return {name: {count, errors, p50, p95, sum, bytes}} over recent completed or failed spans."""
+        summary = {}
+        for name, bucket in sorted(self._load().items()):
+            if prefix and not name.startswith(prefix):
+                continue
+            samples = [sample for sample in bucket if sample.get('status') in ('ok', 'error')]
+            if not samples:
+                continue
+            durations = sorted(sample['duration'] for sample in samples)
+            summary[name] = {
+                'count': len(samples),
+                'errors': sum(1 for sample in samples if sample.get('status') == 'error'),
+                'p50': _percentile(durations, 0.5),
+                'p95': _percentile(durations, 0.95),
+                'sum': sum(durations),
+                'bytes': sum(sample.get('bytes', 0) for sample in samples)
+            }
+        return summary
+
+    def prometheus_text(self):
+        """Render the summary in the Prometheus text exposition format."""
+        lines = [
+            "# HELP deploy_bot_span_duration_seconds Duration of recent sync stages and client calls.",
+            "# TYPE deploy_bot_span_duration_seconds summary",
+        ]
+        summary = self.summary()
+        for name, stats in summary.items():
+            label = name.replace('\\', '\\\\').replace('"', '\\"')
+            lines.append(f'deploy_bot_span_duration_seconds{{span="{label}",quantile="0.5"}} {stats["p50"]}')
+            lines.append(f'deploy_bot_span_duration_seconds{{span="{label}",quantile="0.95"}} {stats["p95"]}')
+            lines.append(f'deploy_bot_span_duration_seconds_sum{{span="{label}"}} {stats["sum"]}')
+            lines.append(f'deploy_bot_span_duration_seconds_count{{span="{label}"}} {stats["count"]}')
+        lines.append("# HELP deploy_bot_span_bytes Bytes transferred by recent spans.")
+        lines.append("# TYPE deploy_bot_span_bytes gauge")
+        for name, stats in summary.items():
+            label = name.replace('\\', '\\\\').replace('"', '\\"')
+            lines.append(f'deploy_bot_span_bytes{{span="{label}"}} {stats["bytes"]}')
+        lines.append("# HELP deploy_bot_span_errors Failed spans among recent samples.")
+        lines.append("# TYPE deploy_bot_span_errors gauge")
+        for name, stats in summary.items():
+            label = name.replace('\\', '\\\\').replace('"', '\\"')
+            lines.append(f'deploy_bot_span_errors{{span="{label}"}} {stats["errors"]}')
+        return '\n'.join(lines) + '\n'
+
+store = MetricsStore()
+
+def span(name, **attrs):
+    """Time a block with the default metrics store: `async with span("github.x") as s:`"""
+    return store.span(name, **attrs)
+
+def add_bytes(count):
+    """Add transferred bytes to the span currently running in this task, if any."""
+    current = _current_span.get()
+    if current is not None:
+        current.bytes += count
+
+def set_attr(key, value):
+    """Attach an attribute (exit code, cache hit, ...) to the current span, if any."""
+    current = _current_span.get()
+    if current is not None:
+        current.attrs[key] = value
+
+def timed(name):
+    """Decorator recording every call of an async function as a span."""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            async with span(name):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+async def start_metrics_server(host=None, port=None):
+    """Serve /metrics in Prometheus text format. Returns the aiohttp runner to clean up."""
+    from aiohttp import web
+
+    async def handle_metrics(request):
+        return web.Response(text=store.prometheus_text(), content_type='text/plain', charset='utf-8')
+
+    app = web.Application()
+    app.router.add_get('/metrics', handle_metrics)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, host or Config.METRICS_HOST, port or Config.METRICS_PORT)
+    await site.start()
+    logger.info(f"Prometheus metrics available on http://{host or Config.METRICS_HOST}:{port or Config.METRICS_PORT}/metrics")
+    return runner
@@ -0,0 +1,172 @@
+import asyncio
+import logging
+import random
+import time
+from contextlib import asynccontextmanager
+import aiohttp
+from config import Config
+from metrics import set_attr
+
+logger = logging.getLogger(__name__)
+
+class TokenBucket:
+    """Async token bucket: at most `rate_per_minute` acquisitions per minute on average.
+
+    Up to `capacity` tokens can be spent in a burst; waiters are served in order.
+    """
+
+    def __init__(self, rate_per_minute, capacity=None):
+        self.rate = max(rate_per_minute, 1) / 60.0
+        self.capacity = capacity or max(1, min(rate_per_minute, 5))
+        self.tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self):
+        """Wait until a token is available and take it."""
+        async with self._lock:
+            self._refill()
+            while self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+                self._refill()
+            self.tokens -= 1
+
+class RequestError(Exception):
+    """An HTTP request failed; `status` is the last HTTP status (None for connection errors)."""
+
+    def __init__(self, message, status=None, url=None):
+        super().__init__(message)
+        self.status = status
+        self.url = url
+
+class RateLimitError(RequestError):
+    """The API kept rate limiting us; `retry_after` is when it says to try again (seconds)."""
+
+    def __init__(self, message, status=None, url=None, retry_after=None):
+        super().__init__(message, status, url)
+        self.retry_after = retry_after
+
+class TransientError(RequestError):
+    """A 5xx response or connection failure that persisted through every retry."""
+
+RETRY_STATUSES = (500, 502, 503, 504)
+
+def _header_number(headers, name):
+    value = headers.get(name)
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+class RequestScheduler:
+    """Shared pacing and retry policy for one API (GitHub, Open Cloud).
+
+    Every request takes a token from a TokenBucket, and the X-RateLimit-Remaining /
+    X-RateLimit-Reset and Retry-After headers of each response are tracked. When the
+    quota is used up, or the API answers 429 (or GitHub's rate-limit 403), every caller
+    waits until the reset instead of failing. 429 and 5xx responses and connection
+    errors are retried with jittered exponential backoff; a wait longer than
+    RATE_LIMIT_MAX_WAIT_SECONDS raises RateLimitError instead.
+    """
+
+    def __init__(self, name, rate_per_minute, capacity=None, max_retries=None, max_wait=None):
+        self.name = name
+        self.bucket = TokenBucket(rate_per_minute, capacity)
+        self.max_retries = Config.REQUEST_MAX_RETRIES if max_retries is None else max_retries
+        self.max_wait = Config.RATE_LIMIT_MAX_WAIT_SECONDS if max_wait is None else max_wait
+        self.remaining = None
+        self.reset_at = None
+        self._paused_until = 0.0
+
+    def update(self, headers):
+        """Record the rate-limit headers of a response."""
+        remaining = _header_number(headers, 'X-RateLimit-Remaining')
+        reset = _header_number(headers, 'X-RateLimit-Reset')
+        if remaining is not None:
+            self.remaining = remaining
+        if reset is not None:
+            # GitHub sends an epoch timestamp, Open Cloud the seconds until the reset
+            seconds = reset - time.time() if reset > 1e9 else reset
+            self.reset_at = time.monotonic() + max(0.0, seconds)
+
+    def pause(self, seconds):
+        """Hold every request of this scheduler for `seconds`."""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def retry_delay(self, attempt):
+        """Jittered exponential backoff for retry number `attempt` (1-based)."""
+        return min(Config.REQUEST_BACKOFF_SECONDS * (2 ** (attempt - 1)), 60) * random.uniform(0.5, 1.0)
+
+    def _wait_time(self):
+        now = time.monotonic()
+        wait = self._paused_until - now
+        if self.remaining is not None and self.remaining < 1 and self.reset_at and self.reset_at > now:
+            wait = max(wait, self.reset_at - now)
+        return wait
+
+    async def acquire(self):
+        """Wait for a token and for any rate-limit pause to end."""
+        wait = self._wait_time()
+        if wait > self.max_wait:
+            raise RateLimitError(f"{self.name} rate limit exhausted, resets in {wait:.0f}s", retry_after=wait)
+        if wait > 0:
+            logger.warning(f"{self.name} rate limit reached, waiting {wait:.1f}s")
+            await asyncio.sleep(wait)
+        await self.bucket.acquire()
+        if self.remaining is not None:
+            self.remaining -= 1
+
+    @asynccontextmanager
+    async def request(self, session, method, url, error_prefix, ok_statuses=(200,), **kwargs):
+        """Send a request through the scheduler and yield the response.
+
+        Statuses outside `ok_statuses` that are not retried raise RequestError
+        with the message "<error_prefix>: <status>".
+        """
+        attempt = 0
+        while True:
+            attempt += 1
+            await self.acquire()
+            try:
+                response = await session.request(method, url, **kwargs)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if attempt > self.max_retries:
+                    raise TransientError(f"{error_prefix}: {e or type(e).__name__}", url=url)
+                delay = self.retry_delay(attempt)
+                logger.warning(f"{self.name} request failed ({e or type(e).__name__}), retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+                continue
+
+            self.update(response.headers)
+            status = response.status
+            if status in ok_statuses:
+                break
+            retry_after = _header_number(response.headers, 'Retry-After')
+            rate_limited = status == 429 or (status == 403 and self.remaining is not None and self.remaining < 1)
+            response.release()
+            if not rate_limited and status not in RETRY_STATUSES:
+                raise RequestError(f"{error_prefix}: {status}", status, url)
+            if attempt > self.max_retries:
+                if rate_limited:
+                    raise RateLimitError(f"{error_prefix}: {status} (rate limited)", status, url, retry_after)
+                raise TransientError(f"{error_prefix}: {status}", status, url)
+            delay = retry_after if retry_after is not None else self.retry_delay(attempt)
+            if rate_limited:
+                # Everyone sharing this scheduler waits, not just this request
+                self.pause(delay)
+                logger.warning(f"{self.name} returned {status}, pausing requests for {delay:.1f}s")
+            else:
+                logger.warning(f"{self.name} returned {status}, retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+        if attempt > 1:
+            set_attr('retries', attempt - 1)
+        try:
+            yield response
+        finally:
+            response.release()
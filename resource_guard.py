@@ -0,0 +1,126 @@
+import asyncio
+import logging
+import os
+import shutil
+import sys
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+class ResourceLimitError(Exception):
+    """Raised when a deploy run would exceed its scratch disk quota or fill the disk."""
+
+def directory_size(path):
+    """Total size in bytes of the files under `path` (0 if it does not exist)."""
+    total = 0
+    for current, _, names in os.walk(path):
+        for name in names:
+            try:
+                total += os.lstat(os.path.join(current, name)).st_size
+            except OSError:
+                pass
+    return total
+
+def current_rss():
+    """Resident set size of this process in bytes.
+
+    Read from /proc where available; elsewhere the process-wide peak is the best
+    figure the standard library offers, and 0 where it offers none (Windows).
+    """
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+class RunResources:
+    """Scratch disk quota and peak memory/disk tracking for one deploy run.
+
+    Disk use is the size of the run's working directory plus any `track`ed files
+    kept elsewhere (the repository archive while it is being downloaded). `check`
+    measures it and fails the run once it is over `max_bytes`, or when less than
+    `min_free_bytes` would be left on the disk; `available` is what a download may
+    still write. Both walk the directory in an executor so the event loop keeps
+    serving other work. Memory is sampled by `monitor` while the run is in progress.
+    """
+
+    def __init__(self, workdir, max_bytes=None, min_free_bytes=None):
+        self.workdir = workdir
+        self.max_bytes = Config.SCRATCH_MAX_MB * 1024 * 1024 if max_bytes is None else max_bytes
+        self.min_free_bytes = Config.MIN_FREE_DISK_MB * 1024 * 1024 if min_free_bytes is None else min_free_bytes
+        self.tracked = set()
+        self.peak_disk = 0
+        self.peak_memory = 0
+
+    def track(self, path):
+        self.tracked.add(path)
+
+    def untrack(self, path):
+        self.tracked.discard(path)
+
+    def usage(self):
+        total = directory_size(self.workdir)
+        for path in self.tracked:
+            try:
+                total += os.path.getsize(path)
+            except OSError:
+                pass
+        self.peak_disk = max(self.peak_disk, total)
+        return total
+
+    def _free_bytes(self):
+        path = self.workdir
+        while not os.path.exists(path):
+            parent = os.path.dirname(path)
+            if parent == path:
+                return None
+            path = parent
+        return shutil.disk_usage(path or '.').free
+
+    async def available(self):
+        """Bytes the run may still write, or None when neither limit applies."""
+        return await asyncio.get_running_loop().run_in_executor(None, self._available)
+
+    def _available(self):
+        limits = []
+        if self.max_bytes:
+            limits.append(self.max_bytes - self.usage())
+        free = self._free_bytes()
+        if free is not None and self.min_free_bytes:
+            limits.append(free - self.min_free_bytes)
+        return max(0, min(limits)) if limits else None
+
+    async def check(self, what, extra_bytes=0):
+        """Raise ResourceLimitError if the run plus `extra_bytes` about to be written is over a limit."""
+        await asyncio.get_running_loop().run_in_executor(None, self._check, what, extra_bytes)
+
+    def _check(self, what, extra_bytes):
+        used = self.usage()
+        self.sample_memory()
+        if self.max_bytes and used + extra_bytes > self.max_bytes:
+            raise ResourceLimitError(
+                f"{what} needs {(used + extra_bytes) / (1024 * 1024):.0f} MB of scratch space, "
+                f"over the {self.max_bytes / (1024 * 1024):.0f} MB limit (SCRATCH_MAX_MB)"
+            )
+        free = self._free_bytes()
+        if free is not None and self.min_free_bytes and free - extra_bytes < self.min_free_bytes:
+            raise ResourceLimitError(
+                f"{what} would leave less than {self.min_free_bytes / (1024 * 1024):.0f} MB free on the disk "
+                f"({free / (1024 * 1024):.0f} MB free, MIN_FREE_DISK_MB)"
+            )
+
+    def sample_memory(self):
+        self.peak_memory = max(self.peak_memory, current_rss())
+
+    async def monitor(self, interval=None):
+        """Sample memory until cancelled."""
+        interval = interval or Config.RESOURCE_SAMPLE_INTERVAL
+        while True:
+            self.sample_memory()
+            await asyncio.sleep(interval)
@@ -1,8 +1,20 @@
-import aiohttp
 import asyncio
+import logging
 import os
-import subprocess
+import re
+import time
 from config import Config
+from deploy_state import hash_file
+from http_session import create_session
+from metrics import add_bytes, set_attr, timed
+from rate_limit import RateLimitError, RequestScheduler, TransientError
+
+logger = logging.getLogger(__name__)
+
+# rbxcloud prints the HTTP error it got; these are worth retrying
+_RATE_LIMITED = re.compile(r'\b429\b|too many requests', re.IGNORECASE)
+_SERVER_ERROR = re.compile(r'\b50[0234]\b|internal server error|bad gateway|service unavailable|gateway timeout', re.IGNORECASE)
+_STATUS = re.compile(r'\b(429|50[0234])\b')
 
 class RobloxClient:
     def __init__(self):
@@ -13,81 +25,323 @@ class RobloxClient:
         self.place_file_path = Config.PLACE_FILE_PATH
         self.data_files_dir = Config.DATA_FILES_DIR
         self.lune_script_path = Config.LUNE_SCRIPT_PATH
+        self.rbxcloud_timeout = Config.RBXCLOUD_TIMEOUT
+        self.lune_timeout = Config.LUNE_TIMEOUT
+        self.session = None
+        self.lune_worker = None
+        if Config.LUNE_PERSISTENT_WORKER:
+            from lune_worker import LuneWorker
+            self.lune_worker = LuneWorker()
+        # Hash of the place file the worker saved last; a matching input needs no reload
+        self._worker_place_hash = None
+        self._worker_lock = asyncio.Lock()
+        # Shared by every Open Cloud call (rbxcloud and HTTP) so parallel place deploys respect one limit
+        self.scheduler = RequestScheduler('Open Cloud', Config.OPEN_CLOUD_REQUESTS_PER_MINUTE)
+    
+    async def start(self):
+        """Open the shared HTTP session used for Roblox web API calls."""
+        if self.session is None or self.session.closed:
+            self.session = create_session()
+    
+    async def close(self):
+        """Stop the Lune worker and close the shared HTTP session and its pooled connections."""
+        if self.lune_worker is not None:
+            await self.lune_worker.stop()
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
+        self.session = None
+    
+    async def _get_session(self):
+        if self.session is None or self.session.closed:
+            await self.start()
+        return self.session
+    
+    async def _run_command(self, cmd, timeout, error_prefix):
+        """Run an external tool without blocking the event loop.
+
+        stdout/stderr are streamed to the log line by line while the process runs.
+        The process is killed if it exceeds `timeout` seconds or the calling task
+        is cancelled. Returns the collected stdout; raises on a non-zero exit code.
+        """
+        started = time.perf_counter()
+        process = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            limit=1024 * 1024
+        )
+        tool = os.path.basename(cmd[0])
+        stdout_lines = []
+        stderr_lines = []
+
+        async def pump(stream, lines):
+            async for raw_line in stream:
+                line = raw_line.decode('utf-8', errors='replace').rstrip()
+                lines.append(line)
+                if line:
+                    logger.info(f"[{tool}] {line}")
+
+        pumps = [
+            asyncio.ensure_future(pump(process.stdout, stdout_lines)),
+            asyncio.ensure_future(pump(process.stderr, stderr_lines))
+        ]
+        try:
+            await asyncio.wait_for(process.wait(), timeout=timeout)
+            set_attr('exit_code', process.returncode)
+            set_attr('exit_time', round(time.perf_counter() - started, 4))
+        except asyncio.TimeoutError:
+            await self._kill_process(process)
+            raise Exception(f"{error_prefix}: {tool} timed out after {timeout}s")
+        except asyncio.CancelledError:
+            await self._kill_process(process)
+            raise
+        finally:
+            # The pipes hit EOF once the process is gone, so the pumps drain quickly
+            await asyncio.gather(*pumps, return_exceptions=True)
+
+        stdout = '\n'.join(stdout_lines)
+        stderr = '\n'.join(stderr_lines)
+        if process.returncode != 0:
+            raise Exception(f"{error_prefix}: {stderr or stdout or f'exit code {process.returncode}'}")
+        return stdout
+
+    async def _run_open_cloud(self, cmd, error_prefix):
+        """Run an rbxcloud command paced by the Open Cloud scheduler.
+
+        Failures that report a rate limit or a 5xx are retried with jittered backoff;
+        a rate limit also pauses every other Open Cloud call for that long. Once the
+        retries are used up they raise RateLimitError or TransientError.
+        """
+        attempt = 0
+        while True:
+            attempt += 1
+            await self.scheduler.acquire()
+            try:
+                return await self._run_command(cmd, self.rbxcloud_timeout, error_prefix)
+            except FileNotFoundError:
+                raise
+            except Exception as e:
+                message = str(e)
+                rate_limited = bool(_RATE_LIMITED.search(message))
+                if 'timed out' in message or not (rate_limited or _SERVER_ERROR.search(message)):
+                    raise
+                if attempt > self.scheduler.max_retries:
+                    match = _STATUS.search(message)
+                    status = int(match.group(1)) if match else None
+                    if rate_limited:
+                        raise RateLimitError(f"{message} (rate limited)", status or 429) from e
+                    raise TransientError(message, status) from e
+                delay = self.scheduler.retry_delay(attempt)
+                logger.warning(f"rbxcloud failed ({message}), retrying in {delay:.1f}s")
+                if rate_limited:
+                    self.scheduler.pause(delay)
+                else:
+                    await asyncio.sleep(delay)
+                set_attr('retries', attempt)
+
+    @staticmethod
+    async def _kill_process(process):
+        """Kill a subprocess that is still running and reap it."""
+        if process.returncode is None:
+            try:
+                process.kill()
+            except ProcessLookupError:
+                pass
+            await process.wait()
     
-    async def download_place_file(self):
-        """Download the latest place file using rbxcloud (Open Cloud API)."""
-        os.makedirs(self.temp_dir, exist_ok=True)
+    @timed('roblox.download_place_file')
+    async def download_place_file(self, place_file_path=None, place_id=None, universe_id=None):
+        """Download the latest place file using rbxcloud (Open Cloud API).
+
+        Writes to `place_file_path`, or the configured PLACE_FILE_PATH if not given.
+        `place_id`/`universe_id` default to the configured PLACE_ID/UNIVERSE_ID.
+        """
+        place_file_path = place_file_path or self.place_file_path
+        place_id = place_id or self.place_id
+        universe_id = universe_id or self.universe_id
+        os.makedirs(os.path.dirname(place_file_path) or self.temp_dir, exist_ok=True)
         if not self.api_key:
             raise Exception("ROBLOX_API_KEY is missing")
         try:
             cmd = [
                 "rbxcloud", "place", "download",
-                "--place-id", str(self.place_id),
-                "--universe-id", str(self.universe_id),
+                "--place-id", str(place_id),
+                "--universe-id", str(universe_id),
                 "--api-key", self.api_key,
-                "--output", self.place_file_path
+                "--output", place_file_path
             ]
-            subprocess.run(cmd, capture_output=True, text=True, check=True)
+            await self._run_open_cloud(cmd, "Failed to download place file")
+            add_bytes(os.path.getsize(place_file_path))
             return True
-        except subprocess.CalledProcessError as e:
-            raise Exception(f"Failed to download place file: {e.stderr or e.stdout}")
         except FileNotFoundError:
             raise Exception("rbxcloud not found. Please install: cargo install rbxcloud")
     
-    async def sync_data_files(self):
-        """Use Lune to sync data files into the place file"""
+    @timed('roblox.sync_data_files')
+    async def sync_data_files(self, data_dir=None, place_file_path=None, changed_files=None, removed_files=None,
+                              compiled_files=None):
+        """Use Lune to sync data files into the place file
+
+        Paths default to the configured DATA_FILES_DIR and PLACE_FILE_PATH.
+        When `changed_files` ({relative path: sha256}) is given, Lune only applies
+        those files (and deletes the modules of `removed_files`) instead of walking
+        the whole data tree. `compiled_files` ({relative path: (key, module path)})
+        points JSON files at their precompiled Luau source, with `key` as their hash.
+        Returns Lune's counts of created/updated/skipped/removed modules, or an
+        empty dict if the script did not report them.
+        With LUNE_PERSISTENT_WORKER the request goes to the long-lived Lune worker.
+        """
+        data_dir = data_dir or self.data_files_dir
+        place_file_path = place_file_path or self.place_file_path
         if not os.path.exists(self.lune_script_path):
             raise Exception(f"Lune script not found at {self.lune_script_path}")
         
-        if not os.path.exists(self.data_files_dir):
-            raise Exception(f"Data files directory not found at {self.data_files_dir}")
+        if not os.path.exists(data_dir):
+            raise Exception(f"Data files directory not found at {data_dir}")
+        
+        manifest_path = None
+        if changed_files is not None:
+            manifest_path = f"{place_file_path}.manifest"
+            self._write_manifest(manifest_path, changed_files, removed_files or [], compiled_files or {})
+        if self.lune_worker is not None:
+            return await self._sync_with_worker(data_dir, place_file_path, manifest_path)
         
         cmd = [
             "lune", "run", self.lune_script_path,
-            "--place-file", self.place_file_path,
-            "--data-dir", self.data_files_dir
+            "--place-file", place_file_path,
+            "--data-dir", data_dir
         ]
+        if manifest_path:
+            cmd += ["--manifest", manifest_path]
         
         try:
-            result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-            return True
-        except subprocess.CalledProcessError as e:
-            raise Exception(f"Failed to sync data files: {e.stderr}")
+            output = await self._run_command(cmd, self.lune_timeout, "Failed to sync data files")
+        except FileNotFoundError:
+            raise Exception("lune not found. Please install: cargo install lune")
+        match = re.search(r"SYNC_RESULT created=(\d+) updated=(\d+) skipped=(\d+) removed=(\d+)", output)
+        if not match:
+            return {}
+        counts = dict(zip(('created', 'updated', 'skipped', 'removed'), map(int, match.groups())))
+        for key, value in counts.items():
+            set_attr(f"modules_{key}", value)
+        return counts
+    
+    async def _sync_with_worker(self, data_dir, place_file_path, manifest_path):
+        """Apply a sync through the persistent Lune worker.
+
+        The worker only reloads the place when the input file differs from the one
+        it saved last time (e.g. someone published from Studio in between).
+        """
+        loop = asyncio.get_running_loop()
+        # Held across the reload decision and the request so parallel places cannot interleave
+        async with self._worker_lock:
+            place_hash = await loop.run_in_executor(None, hash_file, place_file_path)
+            reload = not self.lune_worker.running or place_hash != self._worker_place_hash
+            self._worker_place_hash = None
+            response = await self.lune_worker.request({
+                'op': 'sync',
+                'place_file': os.path.abspath(place_file_path),
+                'data_dir': os.path.abspath(data_dir),
+                'manifest': os.path.abspath(manifest_path) if manifest_path else None,
+                'reload': reload
+            })
+            set_attr('lune_worker', True)
+            set_attr('place_loaded', bool(response.get('loaded')))
+            if not response.get('ok'):
+                raise Exception(f"Failed to sync data files: {response.get('error', 'unknown error')}")
+            self._worker_place_hash = await loop.run_in_executor(None, hash_file, place_file_path)
+        counts = {key: int(response.get(key, 0)) for key in ('created', 'updated', 'skipped', 'removed')}
+        for key, value in counts.items():
+            set_attr(f"modules_{key}", value)
+        return counts
+    
+    @staticmethod
+    def _write_manifest(path, changed_files, removed_files, compiled_files):
+        """Write the tab-separated change manifest read by lune_sync.luau."""
+        with open(path, 'w', encoding='utf-8', newline='\n') as f:
+            # Removals first, so a module renamed onto the same name (Sword.json -> Sword.luau) survives
+            for relative_path in sorted(removed_files):
+                f.write(f"D\t-\t{relative_path}\n")
+            for relative_path, digest in sorted(changed_files.items()):
+                if relative_path in compiled_files:
+                    key, source_path = compiled_files[relative_path]
+                    f.write(f"M\t{key}\t{relative_path}\t{os.path.abspath(source_path)}\n")
+                else:
+                    f.write(f"M\t{digest}\t{relative_path}\n")
     
-    async def publish_place(self):
-        """Publish the updated place to Roblox using rbxcloud."""
-        if not os.path.exists(self.place_file_path):
+    @timed('roblox.publish_place')
+    async def publish_place(self, place_file_path=None, place_id=None, universe_id=None):
+        """Publish the updated place to Roblox using rbxcloud.
+
+        Returns the new version number reported by rbxcloud, or None if its output
+        did not include one.
+        """
+        place_file_path = place_file_path or self.place_file_path
+        place_id = place_id or self.place_id
+        universe_id = universe_id or self.universe_id
+        if not os.path.exists(place_file_path):
             raise Exception("Place file not found")
         if not self.api_key:
             raise Exception("ROBLOX_API_KEY is missing")
         try:
             cmd = [
                 "rbxcloud", "place", "upload",
-                "--universe-id", str(self.universe_id),
-                "--place-id", str(self.place_id),
-                "--file", self.place_file_path,
+                "--universe-id", str(universe_id),
+                "--place-id", str(place_id),
+                "--file", place_file_path,
                 "--api-key", self.api_key
             ]
-            subprocess.run(cmd, capture_output=True, text=True, check=True)
-            return True
-        except subprocess.CalledProcessError as e:
-            raise Exception(f"Failed to publish place: {e.stderr or e.stdout}")
+            output = await self._run_open_cloud(cmd, "Failed to publish place")
+            add_bytes(os.path.getsize(place_file_path))
+            match = re.search(r'"?versionNumber"?\s*[:=]\s*(\d+)', output)
+            version = int(match.group(1)) if match else None
+            set_attr('version', version)
+            return version
         except FileNotFoundError:
             raise Exception("rbxcloud not found. Please install: cargo install rbxcloud")
     
+    @timed('roblox.get_place_version')
+    async def get_place_version(self, place_id=None):
+        """Return the latest published version number of a place (Open Cloud assets API)."""
+        place_id = place_id or self.place_id
+        if not self.api_key:
+            raise Exception("ROBLOX_API_KEY is missing")
+        session = await self._get_session()
+        url = f"{Config.OPEN_CLOUD_API_URL}/assets/v1/assets/{place_id}/versions"
+        headers = {'x-api-key': self.api_key}
+        async with self.scheduler.request(session, 'GET', url, "Failed to get place version",
+                                          headers=headers, params={'maxPageSize': 1}) as response:
+            data = await response.json()
+        versions = data.get('assetVersions') or []
+        if not versions:
+            raise Exception("Failed to get place version: no versions returned")
+        # Paths look like "assets/<place id>/versions/<version number>"
+        return int(versions[0]['path'].rsplit('/', 1)[-1])
+    
+    @timed('roblox.get_place_info')
     async def get_place_info(self):
         """Get information about the current place using Roblox API"""
-        async with aiohttp.ClientSession() as session:
-            url = f"https://games.roblox.com/v1/games?universeIds={self.universe_id}"
-            async with session.get(url) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    if data.get('data'):
-                        return data['data'][0]
-                raise Exception(f"Failed to get place info: {response.status}")
+        session = await self._get_session()
+        url = f"https://games.roblox.com/v1/games?universeIds={self.universe_id}"
+        async with self.scheduler.request(session, 'GET', url, "Failed to get place info") as response:
+            data = await response.json()
+        if data.get('data'):
+            return data['data'][0]
+        raise Exception("Failed to get place info: universe not found")
     
     def cleanup_temp_files(self):
-        """Clean up temporary files"""
+        """Clean up per-run scratch files, keeping the persistent cache if it lives under TEMP_DIR"""
         import shutil
-        if os.path.exists(self.temp_dir):
-            shutil.rmtree(self.temp_dir)
+        if not os.path.exists(self.temp_dir):
+            return
+        cache_dir = os.path.abspath(Config.CACHE_DIR)
+        for entry in os.listdir(self.temp_dir):
+            path = os.path.abspath(os.path.join(self.temp_dir, entry))
+            if cache_dir == path or cache_dir.startswith(path + os.sep):
+                continue
+            if os.path.isdir(path) and not os.path.islink(path):
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
@@ -0,0 +1,67 @@
+import asyncio
+
+class StageGraph:
+    """Run async stages as soon as the stages they depend on have finished.
+
+    Independent stages run concurrently. If a critical stage raises, every other
+    stage still running is cancelled (killing its subprocesses) and the error is
+    re-raised, so a sync fails as soon as either branch fails. A non-critical
+    stage only takes its dependents down with it; its error is kept in `errors`.
+    """
+
+    def __init__(self):
+        self._stages = {}
+        self.errors = {}
+
+    def add(self, name, func, deps=(), critical=True):
+        """Register `func(results)` to run after every stage named in `deps`.
+
+        `results` maps each finished stage name to the value it returned.
+        """
+        if name in self._stages:
+            raise ValueError(f"Stage {name!r} is already registered")
+        for dep in deps:
+            if dep not in self._stages:
+                raise ValueError(f"Stage {name!r} depends on unknown stage {dep!r}")
+        self._stages[name] = (func, tuple(deps), critical)
+        return self
+
+    async def run(self):
+        """Run every stage and return a dict of stage name -> result."""
+        results = {}
+        tasks = {}
+
+        async def run_stage(name):
+            func, deps, _ = self._stages[name]
+            if deps:
+                await asyncio.gather(*(tasks[dep] for dep in deps))
+            results[name] = await func(results)
+            return results[name]
+
+        # Stages are registered after their dependencies, so creation order is safe
+        for name in self._stages:
+            tasks[name] = asyncio.ensure_future(run_stage(name))
+        names = {task: name for name, task in tasks.items()}
+
+        try:
+            pending = set(tasks.values())
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_EXCEPTION)
+                for task in done:
+                    if task.cancelled() or task.exception() is None:
+                        continue
+                    name = names[task]
+                    if self._stages[name][2]:
+                        raise task.exception()
+                    self.errors[name] = task.exception()
+            return results
+        finally:
+            running = [task for task in tasks.values() if not task.done()]
+            for task in running:
+                task.cancel()
+            if running:
+                await asyncio.gather(*running, return_exceptions=True)
+            # Errors re-raised through a dependency are the same object; mark them retrieved
+            for task in tasks.values():
+                if task.done() and not task.cancelled():
+                    task.exception()
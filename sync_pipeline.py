@@ -0,0 +1,407 @@
+import asyncio
+import logging
+import os
+import shutil
+import zipfile
+from dataclasses import dataclass, field
+from typing import List
+from config import Config
+from data_validation import DataValidationError, validate_data_files
+from deploy_state import hash_data_files, diff_file_hashes
+from luau_serializer import compile_json_files
+from metrics import set_attr, span
+from resource_guard import RunResources
+from stage_graph import StageGraph
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class TargetResult:
+    """Outcome of a deploy for one place."""
+    name: str
+    place_id: int
+    status: str = 'pending'  # 'published', 'up_to_date', 'no_changes' or 'failed'
+    error: str = ""
+    changed_files: int = 0
+    removed_files: int = 0
+    # Lune's created/updated/skipped/removed ModuleScript counts
+    modules: dict = field(default_factory=dict)
+    place_cached: bool = False  # the place file came from the place cache instead of a download
+
+@dataclass
+class SyncResult:
+    """Outcome of one deploy run, shared by every interaction waiting on it."""
+    status: str  # 'published', 'partial', 'up_to_date' or 'no_changes'
+    branch: str
+    commit_sha: str
+    commit_message: str = ""
+    used_delta: bool = False
+    changed_files: List[str] = field(default_factory=list)
+    removed_files: List[str] = field(default_factory=list)
+    total_files: int = 0
+    targets: List[TargetResult] = field(default_factory=list)
+    # Highest memory use of the bot process and scratch disk use seen during the run
+    peak_memory_bytes: int = 0
+    peak_disk_bytes: int = 0
+
+class SyncSkipped(Exception):
+    """Raised by a stage to end the run early because there is nothing to publish."""
+
+def _timed_stage(name, func):
+    """Wrap a stage so every run is recorded as a `stage.<name>` span."""
+    async def run_stage(results):
+        async with span(f"stage.{name}") as stage_span:
+            try:
+                return await func(results)
+            except SyncSkipped:
+                stage_span.status = 'skipped'
+                raise
+    return run_stage
+
+class SyncPipeline:
+    """The GitHub -> Lune -> Roblox deploy steps, run inside one job's working directory."""
+
+    def __init__(self, github_client, roblox_client, deploy_state, archive_cache, blob_cache, targets=None,
+                 place_cache=None, luau_cache=None):
+        self.github_client = github_client
+        self.roblox_client = roblox_client
+        self.deploy_state = deploy_state
+        self.archive_cache = archive_cache
+        self.blob_cache = blob_cache
+        self.place_cache = place_cache
+        self.luau_cache = luau_cache
+        self.targets = targets or Config.DEPLOY_TARGETS
+
+    async def run(self, branch: str, force: bool, workdir: str, report) -> SyncResult:
+        """Deploy `branch` to every target place using `workdir` as scratch space.
+
+        `report` is an async callable receiving human-readable progress lines.
+        The repository is fetched and extracted once; each place then runs its own
+        download -> Lune -> publish chain, at most DEPLOY_WORKERS steps at a time.
+        The GitHub side and the place downloads do not depend on each other, so
+        they run concurrently as a stage graph:
+
+            commit -> data -> validate -> compile --+
+                                                    +--> lune:<place> -> publish:<place>
+            commit -> place:<place> ----------------+
+        """
+        data_files_dir = os.path.join(workdir, 'data_files')
+        result = SyncResult(
+            status='published',
+            branch=branch,
+            commit_sha="",
+            targets=[TargetResult(target.name, target.place_id) for target in self.targets]
+        )
+        target_results = dict(zip((target.name for target in self.targets), result.targets))
+        state = {'last_deploys': {}, 'diffs': {}, 'compiled': {}}
+        resources = RunResources(workdir)
+        workers = asyncio.Semaphore(Config.DEPLOY_WORKERS)
+        multi_target = len(self.targets) > 1
+
+        async def commit_stage(results):
+            await report(f"🔄 Fetching latest changes from GitHub... (branch: {branch})")
+            commit_info = await self.github_client.get_latest_commit(branch)
+            result.commit_sha = commit_info['sha']
+            result.commit_message = commit_info['commit']['message']
+            for target in self.targets:
+                last_deploy = None if force else self.deploy_state.get(target.place_id)
+                state['last_deploys'][target.name] = last_deploy
+                if last_deploy and last_deploy.get('commit_sha') == result.commit_sha:
+                    target_results[target.name].status = 'up_to_date'
+            if all(target.status == 'up_to_date' for target in result.targets):
+                result.status = 'up_to_date'
+                raise SyncSkipped()
+
+        async def data_stage(results):
+            await self._fetch_data(result, state, data_files_dir, report, resources)
+            for target in self.targets:
+                target_result = target_results[target.name]
+                if target_result.status != 'pending':
+                    continue
+                last_deploy = state['last_deploys'][target.name]
+                changed, removed = diff_file_hashes(last_deploy.get('files') if last_deploy else None, state['file_hashes'])
+                target_result.changed_files = len(changed)
+                target_result.removed_files = len(removed)
+                state['diffs'][target.name] = (changed, removed)
+                if last_deploy and not changed and not removed:
+                    # New commit, but nothing under the data root changed: remember it and skip this place
+                    self.deploy_state.record(
+                        target.place_id, branch, result.commit_sha, state['file_hashes'], state['data_root_name']
+                    )
+                    target_result.status = 'no_changes'
+            if all(target.status in ('up_to_date', 'no_changes') for target in result.targets):
+                result.status = 'no_changes'
+                raise SyncSkipped()
+
+        async def validate_stage(results):
+            # Fails the run before any place is synced, cancelling place downloads still running
+            await report("🔍 Validating data files...")
+            errors = await asyncio.get_running_loop().run_in_executor(None, validate_data_files, state['data_root'])
+            set_attr('errors', len(errors))
+            if errors:
+                raise DataValidationError(errors)
+
+        async def compile_stage(results):
+            # JSON files changed for any place become Luau table literals, once per content hash
+            paths = sorted({path for changed, _ in state['diffs'].values() for path in changed})
+            state['compiled'] = await asyncio.get_running_loop().run_in_executor(
+                None, compile_json_files, state['data_root'], state['file_hashes'], paths, self.luau_cache
+            )
+            set_attr('files', len(state['compiled']))
+
+        def target_stages(target):
+            target_result = target_results[target.name]
+            place_file_path = os.path.join(workdir, 'places', f"{target.place_id}.rbxl")
+            label = f"[{target.name}] " if multi_target else ""
+
+            async def place_stage(results):
+                if target_result.status != 'pending':
+                    return
+                async with workers:
+                    if await self._use_cached_place(target, place_file_path):
+                        target_result.place_cached = True
+                        await report(f"♻️ {label}Using cached place file (no one published since our last deploy)...")
+                        return
+                    await report(f"🎮 {label}Downloading current place file...")
+                    await self.roblox_client.download_place_file(place_file_path, target.place_id, target.universe_id)
+                await resources.check(f"{label}Place download")
+
+            async def lune_stage(results):
+                if target_result.status != 'pending':
+                    return
+                async with workers:
+                    await report(f"🔄 {label}Syncing data files with Lune...")
+                    # Lune only touches the files that differ from what this place last received
+                    changed, removed = state['diffs'][target.name]
+                    target_result.modules = await self.roblox_client.sync_data_files(
+                        state['data_root'], place_file_path,
+                        {path: state['file_hashes'][path] for path in changed}, removed,
+                        {path: state['compiled'][path] for path in changed if path in state['compiled']}
+                    )
+                await resources.check(f"{label}Lune sync")
+
+            async def publish_stage(results):
+                if target_result.status != 'pending':
+                    return
+                async with workers:
+                    await report(f"🚀 {label}Publishing to Roblox...")
+                    version = await self.roblox_client.publish_place(place_file_path, target.place_id, target.universe_id)
+                if self.place_cache is not None and version is not None:
+                    # What we just published is the next deploy's starting point
+                    try:
+                        await asyncio.get_running_loop().run_in_executor(
+                            None, self.place_cache.store, target.place_id, place_file_path, version
+                        )
+                    except OSError as e:
+                        logger.warning(f"Could not cache place file for {target.place_id}: {e}")
+                # Free the scratch space now instead of when the whole run ends (a cached place was moved away)
+                for path in (place_file_path, f"{place_file_path}.manifest"):
+                    if os.path.exists(path):
+                        os.remove(path)
+                self.deploy_state.record(
+                    target.place_id, branch, result.commit_sha, state['file_hashes'], state['data_root_name']
+                )
+                target_result.status = 'published'
+
+            return place_stage, lune_stage, publish_stage
+
+        graph = StageGraph()
+        graph.add('commit', _timed_stage('commit', commit_stage))
+        graph.add('data', _timed_stage('data', data_stage), deps=['commit'])
+        data_ready = 'data'
+        if Config.VALIDATION_ENABLED:
+            graph.add('validate', _timed_stage('validate', validate_stage), deps=['data'])
+            data_ready = 'validate'
+        if self.luau_cache is not None:
+            graph.add('compile', _timed_stage('compile', compile_stage), deps=[data_ready])
+            data_ready = 'compile'
+        for target in self.targets:
+            place_stage, lune_stage, publish_stage = target_stages(target)
+            # A failing place must not cancel the others, so per-place stages are not critical
+            graph.add(f"place:{target.name}", _timed_stage('place', place_stage), deps=['commit'], critical=False)
+            graph.add(f"lune:{target.name}", _timed_stage('lune', lune_stage),
+                      deps=[data_ready, f"place:{target.name}"], critical=False)
+            graph.add(f"publish:{target.name}", _timed_stage('publish', publish_stage),
+                      deps=[f"lune:{target.name}"], critical=False)
+
+        async with span('stage.total') as total_span:
+            monitor = asyncio.create_task(resources.monitor())
+            try:
+                await graph.run()
+            except SyncSkipped:
+                total_span.status = 'skipped'
+                return result
+            finally:
+                monitor.cancel()
+                resources.sample_memory()
+                result.peak_memory_bytes = resources.peak_memory
+                result.peak_disk_bytes = resources.peak_disk
+                set_attr('peak_memory_mb', round(resources.peak_memory / (1024 * 1024), 1))
+                set_attr('peak_disk_mb', round(resources.peak_disk / (1024 * 1024), 1))
+
+            for target in self.targets:
+                error = graph.errors.get(f"publish:{target.name}")
+                if error is not None:
+                    target_results[target.name].status = 'failed'
+                    target_results[target.name].error = str(error)
+
+            failed = [target for target in result.targets if target.status == 'failed']
+            published = [target for target in result.targets if target.status == 'published']
+            if failed and not published:
+                if not multi_target:
+                    raise graph.errors[f"publish:{failed[0].name}"]
+                raise Exception("Deploy failed for every place: " + "; ".join(f"{t.name}: {t.error}" for t in failed))
+            result.status = 'partial' if failed else 'published'
+        return result
+
+    async def _use_cached_place(self, target, place_file_path):
+        """Copy the cached place file into place if its version is still the live one.
+
+        Returns False (so the caller downloads) on a cache miss, a version mismatch
+        (someone published from Studio) or any error checking the version.
+        """
+        if self.place_cache is None:
+            return False
+        cached = self.place_cache.lookup(target.place_id)
+        if not cached:
+            set_attr('cache_hit', False)
+            return False
+        try:
+            live_version = await self.roblox_client.get_place_version(target.place_id)
+        except Exception as e:
+            logger.warning(f"Could not check the live version of place {target.place_id}, downloading it: {e}")
+            return False
+        if live_version != cached['version']:
+            logger.info(
+                f"Place {target.place_id} is at version {live_version}, cached file is version {cached['version']}; downloading"
+            )
+            set_attr('cache_hit', False)
+            return False
+        copied = await asyncio.get_running_loop().run_in_executor(
+            None, self.place_cache.copy_to, target.place_id, place_file_path, cached['sha256']
+        )
+        set_attr('cache_hit', copied)
+        if not copied:
+            logger.warning(f"Cached place file for {target.place_id} failed its hash check, downloading it")
+        return copied
+
+    async def _fetch_data(self, result, state, data_files_dir, report, resources):
+        """Bring the data files onto disk once for every pending place.
+
+        Uses the delta fetch when every pending place was last deployed from the same
+        commit, otherwise the full archive. An archive too large for the archive cache
+        is deleted as soon as it has been extracted. Downloads and extraction stay
+        within the run's scratch quota (`resources`). Fills state['data_root'],
+        state['data_root_name'] and state['file_hashes'].
+        """
+        loop = asyncio.get_running_loop()
+        full_sha = result.commit_sha
+        pending_deploys = [
+            state['last_deploys'][target.name] for target in result.targets if target.status == 'pending'
+        ]
+        base_deploy = pending_deploys[0] if pending_deploys else None
+        if base_deploy and any(
+            not deploy or deploy.get('commit_sha') != base_deploy.get('commit_sha')
+            or deploy.get('data_root') != base_deploy.get('data_root')
+            for deploy in pending_deploys
+        ):
+            base_deploy = None
+
+        delta = None
+        if base_deploy and base_deploy.get('data_root'):
+            await report(f"🧩 Fetching changed data files since `{base_deploy['commit_sha'][:7]}`...")
+            try:
+                delta = await self.github_client.fetch_changed_data_files(
+                    base_deploy['commit_sha'], full_sha, base_deploy['data_root'],
+                    data_files_dir, self.blob_cache
+                )
+            except Exception as e:
+                logger.warning(f"Delta fetch failed, falling back to full download: {e}")
+                shutil.rmtree(data_files_dir, ignore_errors=True)
+
+        if delta is not None:
+            # Only the changed files are on disk; everything else is already live
+            result.used_delta = True
+            _, removed_files = delta
+            data_root_name = base_deploy['data_root']
+            data_root = data_files_dir
+            changed_hashes = await loop.run_in_executor(None, hash_data_files, data_root)
+            file_hashes = dict(base_deploy.get('files') or {})
+            for path in removed_files:
+                file_hashes.pop(path, None)
+            file_hashes.update(changed_hashes)
+            await resources.check("Fetching changed data files")
+        else:
+            zip_path = self.archive_cache.get(full_sha)
+            archive_cached = zip_path is not None
+            if zip_path:
+                await report(f"📦 Using cached repository archive for `{full_sha[:7]}`...")
+            else:
+                await report("📥 Downloading repository...")
+
+                async def download_progress(done, total, rate):
+                    size = f"{done / (1024 * 1024):.1f}" + (f" / {total / (1024 * 1024):.1f}" if total else "")
+                    await report(f"📥 Downloading repository... {size} MB at {rate / (1024 * 1024):.1f} MB/s")
+
+                # Keyed by commit SHA, so a partial file left by a failed run can be resumed
+                partial_path = self.archive_cache.partial_path_for(full_sha)
+                resources.track(partial_path)
+                for attempt in range(2):
+                    max_bytes = await resources.available()
+                    if max_bytes is not None and os.path.exists(partial_path):
+                        # The limit is on the finished file, which includes what is already on disk
+                        max_bytes += os.path.getsize(partial_path)
+                    await self.github_client.download_repository(partial_path, full_sha, download_progress, max_bytes)
+                    # A truncated or badly resumed zip would otherwise be reused from the cache on every run
+                    if await self.github_client.verify_archive(partial_path):
+                        break
+                    os.remove(partial_path)
+                    if attempt:
+                        raise Exception(f"Downloaded archive of {full_sha[:7]} is corrupt")
+                    logger.warning(f"Downloaded archive of {full_sha[:7]} is corrupt; downloading it again")
+                    await report("📥 Downloaded archive is corrupt, downloading it again...")
+                zip_path = partial_path
+                if self.archive_cache.fits(os.path.getsize(partial_path)):
+                    zip_path = self.archive_cache.put(full_sha, partial_path)
+                    resources.untrack(partial_path)
+                    archive_cached = True
+
+            await report("📂 Extracting data files...")
+            try:
+                repo_root = await self.github_client.extract_data_files(
+                    zip_path, data_files_dir, Config.DATA_ROOTS, await resources.available()
+                )
+                await resources.check("Extracting data files")
+            except zipfile.BadZipFile:
+                if archive_cached:
+                    # Drop the corrupt entry so the next run downloads the archive again
+                    os.remove(zip_path)
+                raise
+            finally:
+                # Also when the extraction fails, or the archive-sized file stays on disk for good
+                if not archive_cached and os.path.exists(zip_path):
+                    logger.info(f"Archive of {full_sha[:7]} does not fit the archive cache; removing it")
+                    os.remove(zip_path)
+                    resources.untrack(zip_path)
+
+            # Point Lune to the first Rojo data root that exists inside the repo
+            data_root_name = next(
+                (root for root in Config.DATA_ROOTS if os.path.isdir(os.path.join(repo_root, *root.split('/')))), None
+            )
+            if not data_root_name:
+                candidate_roots = [os.path.join(repo_root, *root.split('/')) for root in Config.DATA_ROOTS]
+                raise Exception(f"Data directory not found. Tried: {' and '.join(candidate_roots)}")
+            data_root = os.path.join(repo_root, *data_root_name.split('/'))
+            file_hashes = await loop.run_in_executor(None, hash_data_files, data_root)
+
+        changed, removed = set(), set()
+        for deploy in pending_deploys:
+            target_changed, target_removed = diff_file_hashes(deploy.get('files') if deploy else None, file_hashes)
+            changed.update(target_changed)
+            removed.update(target_removed)
+        result.changed_files = sorted(changed)
+        result.removed_files = sorted(removed)
+        result.total_files = len(file_hashes)
+        state['data_root'] = data_root
+        state['data_root_name'] = data_root_name
+        state['file_hashes'] = file_hashes
@@ -0,0 +1,520 @@
+"""Benchmark the /sync deploy pipeline end to end against local fakes.
+
+A fake GitHub API serves synthetic zipballs, and stub `rbxcloud`/`lune` executables
+stand in for the Roblox side, so runs are repeatable and need no credentials.
+Each repeat runs in a fresh bot process with empty state and cache directories,
+and goes through these scenarios in order:
+
+    cold      first deploy: commit lookup, full zipball download, extract, Lune, publish
+    delta     a new commit that changes --changed files (compare API + blobs)
+    noop      the same commit again (already up to date)
+    force     forced redeploy of the head commit (full archive, every file applied)
+
+Results (wall time, per-stage and per-call timings from the metrics spans, peak RSS
+so far, and file-system operations made by the bot process) are printed and written
+as JSON:
+
+    python test/bench_sync.py --files 2000 --file-size 4096 --output before.json
+    python test/bench_sync.py --files 2000 --file-size 4096 --compare before.json
+    python test/bench_sync.py --env LUNE_PERSISTENT_WORKER=true --lune-latency 0.5
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import platform
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import zipfile
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+DATA_ROOT = 'src/ReplicatedStorage/Modules/Data'
+SCENARIOS = ('cold', 'delta', 'noop', 'force')
+# Audit events counted as file-system operations
+FS_EVENTS = {
+    'open', 'os.remove', 'os.rename', 'os.mkdir', 'os.rmdir', 'os.listdir', 'os.scandir',
+    'os.truncate', 'os.chmod', 'os.utime', 'shutil.copyfile', 'shutil.rmtree', 'shutil.move',
+}
+
+RBXCLOUD_STUB = '''#!{python}
+import json, os, sys, time
+args = sys.argv[1:]
+time.sleep(float(os.environ.get('BENCH_RBXCLOUD_LATENCY', '0')))
+def arg(name):
+    return args[args.index(name) + 1]
+if args[:2] == ['place', 'download']:
+    remaining = int(os.environ.get('BENCH_PLACE_BYTES', '0'))
+    block = os.urandom(min(remaining, 1024 * 1024))
+    with open(arg('--output'), 'wb') as f:
+        while remaining > 0:
+            f.write(block[:remaining])
+            remaining -= len(block)
+    print('Downloaded place')
+elif args[:2] == ['place', 'upload']:
+    with open(arg('--file'), 'rb') as f:
+        while f.read(1024 * 1024):
+            pass
+    path = os.path.join(os.environ['BENCH_VERSION_DIR'], arg('--place-id'))
+    version = int(open(path).read()) + 1 if os.path.exists(path) else 1
+    with open(path, 'w') as f:
+        f.write(str(version))
+    print(json.dumps({{'versionNumber': version}}))
+else:
+    sys.exit('unsupported rbxcloud command: ' + ' '.join(args))
+'''
+
+LUNE_STUB = '''#!{python}
+import json, os, sys, time
+
+def rewrite(path):
+    # Lune reads the whole place and writes it back
+    with open(path, 'rb') as f:
+        data = f.read()
+    with open(path + '.tmp', 'wb') as f:
+        f.write(data)
+    os.replace(path + '.tmp', path)
+
+def apply(data_dir, manifest):
+    if manifest:
+        with open(manifest, encoding='utf-8') as f:
+            lines = [line.split('\\t') for line in f.read().splitlines() if line]
+        for line in lines:
+            if line[0] == 'M':
+                source = line[3] if len(line) > 3 else os.path.join(data_dir, *line[2].split('/'))
+                with open(source, 'rb') as f:
+                    f.read()
+        return sum(1 for line in lines if line[0] == 'M'), sum(1 for line in lines if line[0] == 'D')
+    count = 0
+    for current, _, names in os.walk(data_dir):
+        for name in names:
+            with open(os.path.join(current, name), 'rb') as f:
+                f.read()
+            count += 1
+    return count, 0
+
+latency = float(os.environ.get('BENCH_LUNE_LATENCY', '0'))
+args = sys.argv[1:]
+if '--worker' in args:
+    print(json.dumps({{'event': 'ready'}}), flush=True)
+    loaded = False
+    for line in sys.stdin:
+        request = json.loads(line)
+        if request.get('op') == 'shutdown':
+            break
+        if request['reload'] or not loaded:
+            time.sleep(latency)
+            loaded = True
+        updated, removed = apply(request['data_dir'], request['manifest'])
+        rewrite(request['place_file'])
+        print(json.dumps({{'id': request['id'], 'ok': True, 'loaded': request['reload'], 'created': 0,
+                          'updated': updated, 'skipped': 0, 'removed': removed}}), flush=True)
+    sys.exit(0)
+time.sleep(latency)
+updated, removed = apply(args[args.index('--data-dir') + 1], args[args.index('--manifest') + 1] if '--manifest' in args else None)
+rewrite(args[args.index('--place-file') + 1])
+print(f"SYNC_RESULT created=0 updated={{updated}} skipped=0 removed={{removed}}")
+'''
+
+class SyntheticRepo:
+    """Two commits of generated data files, with their zipballs written to `root`.
+
+    Ref `v1` is the initial commit; `v2` changes the first `changed` data files.
+    """
+
+    def __init__(self, root, files, file_size, luau_share, filler_mb, changed):
+        self.root = root
+        self.file_size = file_size
+        self.commits = {}  # sha -> {path: bytes}
+        self.order = []
+        self.heads = {}
+        self.blobs = {}
+        filler = {f"assets/blob{i}.bin": os.urandom(1024 * 1024) for i in range(filler_mb)}
+        luau_files = int(files * luau_share)
+        paths = [f"{DATA_ROOT}/Folder{i // 50}/Item{i}." + ('luau' if i < luau_files else 'json') for i in range(files)]
+        first = {path: self._content(path, 0) for path in paths}
+        second = dict(first)
+        for path in paths[:changed]:
+            second[path] = self._content(path, 1)
+        self._commit('v1', first, filler)
+        self._commit('v2', second, filler)
+
+    def _content(self, path, revision):
+        index = int(path.rsplit('Item', 1)[1].split('.')[0])
+        padding = 'x' * max(0, self.file_size - 120)
+        if path.endswith('.luau'):
+            text = f'return {{\n\tid = {index},\n\trevision = {revision},\n\tname = "Item{index}",\n\tnote = "{padding}",\n}}\n'
+        else:
+            text = json.dumps({'id': index, 'revision': revision, 'name': f"Item{index}", 'note': padding}, indent=1)
+        return text.encode('utf-8')
+
+    def _commit(self, ref, files, filler):
+        sha = hashlib.sha1(f"bench-{ref}".encode('utf-8')).hexdigest()
+        for content in files.values():
+            self.blobs[hashlib.sha1(content).hexdigest()] = content
+        with zipfile.ZipFile(os.path.join(self.root, f"{sha}.zip"), 'w', zipfile.ZIP_DEFLATED) as archive:
+            prefix = f"bench-repo-{sha[:7]}/"
+            archive.writestr(prefix, '')
+            for path, content in sorted({**files, **filler}.items()):
+                archive.writestr(prefix + path, content)
+        self.commits[sha] = files
+        self.order.append(sha)
+        self.heads[ref] = sha
+
+class FakeApiServer:
+    """GitHub REST and Open Cloud endpoints used by the pipeline, served from a background thread."""
+
+    def __init__(self, repo, version_dir):
+        self.repo = repo
+        self.version_dir = version_dir
+        self.loop = asyncio.new_event_loop()
+        self.runner = None
+        self.url = None
+
+    def _handlers(self):
+        from aiohttp import web
+
+        def resolve(ref):
+            return self.repo.heads.get(ref, ref)
+
+        async def commit(request):
+            sha = resolve(request.match_info['ref'])
+            etag = f'"{sha}"'
+            if request.headers.get('If-None-Match') == etag:
+                return web.Response(status=304)
+            return web.json_response({'sha': sha, 'commit': {'message': f"Bench commit {sha[:7]}"}}, headers={'ETag': etag})
+
+        async def zipball(request):
+            return web.FileResponse(os.path.join(self.repo.root, f"{resolve(request.match_info['ref'])}.zip"))
+
+        async def compare(request):
+            base, head = request.match_info['spec'].split('...')
+            old, new = self.repo.commits[base], self.repo.commits[head]
+            files = []
+            for path in sorted(set(old) | set(new)):
+                if path not in new:
+                    files.append({'filename': path, 'status': 'removed'})
+                elif old.get(path) != new[path]:
+                    files.append({'filename': path, 'status': 'modified' if path in old else 'added',
+                                  'sha': hashlib.sha1(new[path]).hexdigest()})
+            status = 'ahead' if self.repo.order.index(base) < self.repo.order.index(head) else 'behind'
+            return web.json_response({'status': status, 'files': files})
+
+        async def blob(request):
+            import base64
+            content = self.repo.blobs.get(request.match_info['sha'])
+            if content is None:
+                return web.Response(status=404)
+            if 'raw' in request.headers.get('Accept', ''):
+                return web.Response(body=content, content_type='application/vnd.github.raw')
+            return web.json_response({'encoding': 'base64', 'content': base64.b64encode(content).decode('ascii')})
+
+        async def versions(request):
+            path = os.path.join(self.version_dir, request.match_info['place_id'])
+            if not os.path.exists(path):
+                return web.json_response({'assetVersions': []})
+            with open(path) as f:
+                version = f.read().strip()
+            return web.json_response({'assetVersions': [{'path': f"assets/{request.match_info['place_id']}/versions/{version}"}]})
+
+        app = web.Application()
+        app.router.add_get('/repos/{owner}/{name}/commits/{ref}', commit)
+        app.router.add_get('/repos/{owner}/{name}/zipball/{ref}', zipball)
+        app.router.add_get('/repos/{owner}/{name}/compare/{spec}', compare)
+        app.router.add_get('/repos/{owner}/{name}/git/blobs/{sha}', blob)
+        app.router.add_get('/assets/v1/assets/{place_id}/versions', versions)
+        return app
+
+    async def _start(self):
+        from aiohttp import web
+        self.runner = web.AppRunner(self._handlers())
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, '127.0.0.1', 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f"http://127.0.0.1:{port}"
+
+    def start(self):
+        threading.Thread(target=self.loop.run_forever, daemon=True).start()
+        asyncio.run_coroutine_threadsafe(self._start(), self.loop).result()
+        return self.url
+
+    def stop(self):
+        asyncio.run_coroutine_threadsafe(self.runner.cleanup(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+class FsCounter:
+    """Count the file-system audit events raised in this process."""
+
+    def __init__(self):
+        self.counts = {}
+        sys.addaudithook(self._hook)
+
+    def _hook(self, event, args):
+        if event in FS_EVENTS:
+            self.counts[event] = self.counts.get(event, 0) + 1
+
+    def reset(self):
+        counts, self.counts = self.counts, {}
+        return counts
+
+def peak_rss_mb():
+    scale = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / (1024 * 1024)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale / (1024 * 1024)
+    return round(own, 1), round(children, 1)
+
+def read_spans(path, offset):
+    if not os.path.exists(path):
+        return [], 0
+    with open(path, 'r', encoding='utf-8') as f:
+        f.seek(offset)
+        lines = f.read()
+        end = f.tell()
+    return [json.loads(line) for line in lines.splitlines() if line], end
+
+def write_stubs(bin_dir):
+    os.makedirs(bin_dir, exist_ok=True)
+    for name, source in (('rbxcloud', RBXCLOUD_STUB), ('lune', LUNE_STUB)):
+        path = os.path.join(bin_dir, name)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(source.format(python=sys.executable))
+        os.chmod(path, 0o755)
+
+def bench_environment(args, work_dir, run_dir, server_url):
+    """Environment of one bot process, pointed at the fakes and at empty directories under `run_dir`."""
+    bin_dir = os.path.join(work_dir, 'bin')
+    targets = ','.join(f"place{i + 1}:{1001 + i}:2001" for i in range(args.places))
+    env = dict(os.environ)
+    env.update({
+        'DISCORD_TOKEN': 'bench', 'GUILD_ID': '0',
+        'GITHUB_TOKEN': 'bench', 'GITHUB_REPO': 'bench/repo', 'GITHUB_BRANCH': 'v1', 'GITHUB_API_URL': server_url,
+        'ROBLOX_API_KEY': 'bench', 'OPEN_CLOUD_API_URL': server_url,
+        'PLACE_ID': '1001', 'UNIVERSE_ID': '2001', 'DEPLOY_TARGETS': targets,
+        'DATA_ROOTS': DATA_ROOT,
+        'TEMP_DIR': os.path.join(run_dir, 'temp'),
+        'STATE_DIR': os.path.join(run_dir, 'state'),
+        'CACHE_DIR': os.path.join(run_dir, 'cache'),
+        'LUNE_SCRIPT_PATH': os.path.join(REPO_DIR, 'lune_sync.luau'),
+        'METRICS_MAX_SAMPLES': '100000',
+        'DOWNLOAD_PROGRESS_INTERVAL': '3600',
+        'BENCH_RBXCLOUD_LATENCY': str(args.rbxcloud_latency),
+        'BENCH_LUNE_LATENCY': str(args.lune_latency),
+        'BENCH_PLACE_BYTES': str(int(args.place_mb * 1024 * 1024)),
+        'BENCH_VERSION_DIR': os.path.join(run_dir, 'versions'),
+        'PATH': bin_dir + os.pathsep + os.environ.get('PATH', ''),
+    })
+    for override in args.env:
+        key, _, value = override.partition('=')
+        env[key] = value
+    os.makedirs(env['BENCH_VERSION_DIR'], exist_ok=True)
+    return env
+
+async def run_scenarios():
+    """Run every scenario once through a deploy queue wired like SyncBot's."""
+    from archive_cache import ArchiveCache, BlobCache, LuauModuleCache, PlaceCache
+    from config import Config
+    from deploy_queue import DeployQueue
+    from deploy_state import DeployStateStore
+    from github_client import GitHubClient
+    from metrics import store
+    from roblox_client import RobloxClient
+    from sync_pipeline import SyncPipeline
+
+    counter = FsCounter()
+    github_client = GitHubClient()
+    roblox_client = RobloxClient()
+    place_cache = PlaceCache() if Config.PLACE_CACHE_ENABLED else None
+    luau_cache = LuauModuleCache() if Config.COMPILE_JSON_TO_LUAU else None
+    pipeline = SyncPipeline(
+        github_client, roblox_client, DeployStateStore(), ArchiveCache(), BlobCache(),
+        place_cache=place_cache, luau_cache=luau_cache
+    )
+    queue = DeployQueue(pipeline.run)
+    await github_client.start()
+    await roblox_client.start()
+    queue.start()
+
+    async def report(text):
+        pass
+
+    results = {}
+    metrics_offset = read_spans(store.path, 0)[1]
+    try:
+        for scenario in SCENARIOS:
+            branch = 'v1' if scenario == 'cold' else 'v2'
+            counter.reset()
+            started = time.perf_counter()
+            job = queue.submit(branch, scenario == 'force', report)
+            result = await job.wait()
+            wall = time.perf_counter() - started
+            await store.flush()
+            fs_ops = counter.reset()
+            spans, metrics_offset = read_spans(store.path, metrics_offset)
+            timings = {}
+            for sample in spans:
+                entry = timings.setdefault(sample['name'], {'count': 0, 'seconds': 0.0, 'bytes': 0})
+                entry['count'] += 1
+                entry['seconds'] = round(entry['seconds'] + sample['duration'], 4)
+                entry['bytes'] += sample.get('bytes', 0)
+            own_rss, child_rss = peak_rss_mb()
+            results[scenario] = {
+                'status': result.status,
+                'wall_seconds': round(wall, 4),
+                'changed_files': len(result.changed_files),
+                'run_peak_memory_mb': round(result.peak_memory_bytes / (1024 * 1024), 1),
+                'run_peak_disk_mb': round(result.peak_disk_bytes / (1024 * 1024), 1),
+                'spans': timings,
+                'fs_ops': fs_ops,
+                'fs_ops_total': sum(fs_ops.values()),
+                'peak_rss_mb': own_rss,
+                'peak_child_rss_mb': child_rss,
+            }
+    finally:
+        await queue.stop()
+        await github_client.close()
+        await roblox_client.close()
+    return results
+
+def summarize(runs):
+    """Median of each numeric measurement over the repeats (peak RSS: maximum)."""
+    summary = {}
+    for scenario in SCENARIOS:
+        samples = [run[scenario] for run in runs]
+        names = sorted({name for sample in samples for name in sample['spans']})
+        events = sorted({event for sample in samples for event in sample['fs_ops']})
+        summary[scenario] = {
+            'status': samples[-1]['status'],
+            'wall_seconds': round(statistics.median(s['wall_seconds'] for s in samples), 4),
+            'spans': {
+                name: round(statistics.median(s['spans'].get(name, {}).get('seconds', 0.0) for s in samples), 4)
+                for name in names
+            },
+            'fs_ops': {event: statistics.median(s['fs_ops'].get(event, 0) for s in samples) for event in events},
+            'fs_ops_total': statistics.median(s['fs_ops_total'] for s in samples),
+            'peak_rss_mb': max(s['peak_rss_mb'] for s in samples),
+            'peak_child_rss_mb': max(s['peak_child_rss_mb'] for s in samples),
+        }
+    return summary
+
+def print_summary(summary):
+    for scenario, data in summary.items():
+        print(f"\n{scenario} ({data['status']}): {data['wall_seconds']:.3f}s wall, "
+              f"{data['fs_ops_total']:g} fs ops, peak RSS {data['peak_rss_mb']} MB (children {data['peak_child_rss_mb']} MB)")
+        for name, seconds in data['spans'].items():
+            print(f"  {name:<36}{seconds:>9.3f}s")
+
+def compare(summary, baseline, threshold):
+    """Print current vs baseline numbers; returns the metrics that got slower/larger than `threshold`."""
+    regressions = []
+    print(f"\nCompared with {baseline.get('label') or baseline.get('revision', 'baseline')}:")
+    print(f"  {'metric':<44}{'before':>10}{'after':>10}{'change':>9}")
+    for scenario, data in summary.items():
+        before = baseline['summary'].get(scenario)
+        if not before:
+            continue
+        metrics = [('wall_seconds', data['wall_seconds'], before['wall_seconds']),
+                   ('fs_ops_total', data['fs_ops_total'], before['fs_ops_total']),
+                   ('peak_rss_mb', data['peak_rss_mb'], before['peak_rss_mb'])]
+        metrics += [(name, seconds, before['spans'][name]) for name, seconds in data['spans'].items()
+                    if name.startswith('stage.') and name in before['spans']]
+        for name, after, old in metrics:
+            change = (after - old) / old if old else 0.0
+            # Timing changes under 10ms are mostly noise
+            regressed = change > threshold and (name in ('fs_ops_total', 'peak_rss_mb') or after - old > 0.01)
+            print(f"  {scenario + ' ' + name:<44}{old:>10.3f}{after:>10.3f}{change:>+8.0%}{' !' if regressed else ''}")
+            if regressed:
+                regressions.append(f"{scenario} {name}")
+    return regressions
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--files', type=int, default=500, help='data files in the synthetic repository')
+    parser.add_argument('--file-size', type=int, default=2048, help='approximate bytes per data file')
+    parser.add_argument('--luau-share', type=float, default=0.2, help='fraction of data files that are .luau')
+    parser.add_argument('--filler-mb', type=int, default=5, help='MB of non-data files in the zipball')
+    parser.add_argument('--changed', type=int, default=20, help='files changed by the delta commit')
+    parser.add_argument('--places', type=int, default=1, help='number of deploy targets')
+    parser.add_argument('--place-mb', type=float, default=20, help='size of the stub place file')
+    parser.add_argument('--rbxcloud-latency', type=float, default=0.1, help='seconds per rbxcloud call')
+    parser.add_argument('--lune-latency', type=float, default=0.2, help='seconds per Lune place load')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per scenario (medians are reported)')
+    parser.add_argument('--env', action='append', default=[], metavar='KEY=VALUE', help='bot setting override (repeatable)')
+    parser.add_argument('--label', help='name stored with the results')
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    parser.add_argument('--compare', metavar='JSON', help='results file of an earlier run to compare against')
+    parser.add_argument('--threshold', type=float, default=0.1, help='relative slowdown reported as a regression')
+    parser.add_argument('--keep', action='store_true', help='keep the scratch directory')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        # One repeat inside a fresh bot process; the parent reads the last stdout line
+        print(json.dumps(asyncio.run(run_scenarios())))
+        return
+
+    work_dir = tempfile.mkdtemp(prefix='bench_sync_')
+    repo_dir = os.path.join(work_dir, 'repo')
+    os.makedirs(repo_dir)
+    write_stubs(os.path.join(work_dir, 'bin'))
+    repo = SyntheticRepo(repo_dir, args.files, args.file_size, args.luau_share, args.filler_mb,
+                         min(args.changed, args.files))
+    server = FakeApiServer(repo, None)
+    runs = []
+    try:
+        server_url = server.start()
+        for index in range(args.repeat):
+            run_dir = os.path.join(work_dir, f"run{index}")
+            env = bench_environment(args, work_dir, run_dir, server_url)
+            server.version_dir = env['BENCH_VERSION_DIR']
+            process = subprocess.run([sys.executable, os.path.abspath(__file__), '--child'], cwd=run_dir, env=env,
+                                     stdout=subprocess.PIPE, text=True)
+            if process.returncode != 0:
+                sys.exit(f"Benchmark run {index + 1} failed with exit code {process.returncode}")
+            runs.append(json.loads(process.stdout.strip().splitlines()[-1]))
+            print(f"run {index + 1}/{args.repeat}: " + ", ".join(f"{name} {runs[-1][name]['wall_seconds']:.2f}s" for name in SCENARIOS))
+    finally:
+        server.stop()
+        if not args.keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    summary = summarize(runs)
+    results = {
+        'label': args.label,
+        'revision': git_revision(),
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'params': {key: value for key, value in vars(args).items() if key not in ('output', 'compare', 'keep')},
+        'summary': summary,
+        'runs': runs,
+    }
+    print_summary(summary)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.output}")
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            regressions = compare(summary, json.load(f), args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) above {args.threshold:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,8 @@
+import os
+import sys
+
+# The checked-in .env holds placeholders; integer settings need real values before config is imported
+for name in ('GUILD_ID', 'PLACE_ID', 'UNIVERSE_ID', 'DEPLOY_CHANNEL_ID'):
+    os.environ.setdefault(name, '0')
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
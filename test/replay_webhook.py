@@ -0,0 +1,59 @@
+"""Send signed GitHub webhook payloads to the bot's listener.
+
+    python test/replay_webhook.py --file "src/ReplicatedStorage/Modules/Data/Units.json"
+    python test/replay_webhook.py --payload push.json --count 5 --interval 1
+"""
+import argparse
+import hashlib
+import hmac
+import json
+import os
+import sys
+import time
+import uuid
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import Config
+
+def build_push(branch, files):
+    return {
+        'ref': f"refs/heads/{branch}",
+        'after': uuid.uuid4().hex + uuid.uuid4().hex[:8],
+        'repository': {'full_name': Config.GITHUB_REPO or 'owner/repo'},
+        'commits': [{'id': uuid.uuid4().hex, 'added': [], 'modified': list(files), 'removed': []}],
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default=f"http://127.0.0.1:{Config.WEBHOOK_PORT}{Config.WEBHOOK_PATH}")
+    parser.add_argument('--secret', default=Config.WEBHOOK_SECRET)
+    parser.add_argument('--event', default='push')
+    parser.add_argument('--branch', default=Config.GITHUB_BRANCH)
+    parser.add_argument('--file', action='append', default=[], help='changed file path (repeatable)')
+    parser.add_argument('--payload', help='JSON payload file (e.g. a delivery copied from GitHub)')
+    parser.add_argument('--count', type=int, default=1, help='number of deliveries to send')
+    parser.add_argument('--interval', type=float, default=0.0, help='seconds between deliveries')
+    args = parser.parse_args()
+
+    for i in range(args.count):
+        if args.payload:
+            with open(args.payload, 'rb') as f:
+                body = f.read()
+        else:
+            files = args.file or [f"{Config.DATA_ROOTS[0]}/Example.json"]
+            body = json.dumps(build_push(args.branch, files)).encode('utf-8')
+        signature = 'sha256=' + hmac.new(args.secret.encode('utf-8'), body, hashlib.sha256).hexdigest()
+        response = requests.post(args.url, data=body, headers={
+            'Content-Type': 'application/json',
+            'X-GitHub-Event': args.event,
+            'X-GitHub-Delivery': str(uuid.uuid4()),
+            'X-Hub-Signature-256': signature,
+        }, timeout=10)
+        print(f"[{i + 1}/{args.count}] {response.status_code} {response.text}")
+        if args.interval and i + 1 < args.count:
+            time.sleep(args.interval)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+import os
+
+from archive_cache import ArchiveCache, PlaceCache
+
+
+def _publish(cache, tmp_path, place_id, version):
+    source = tmp_path / f"{place_id}-{version}.rbxl"
+    source.write_bytes(b'place' * 10)
+    cache.store(place_id, str(source), version)
+
+
+def test_place_cache_round_trip(tmp_path):
+    cache = PlaceCache(str(tmp_path / 'places'), max_bytes=1024, max_entries=2)
+    _publish(cache, tmp_path, 1, 7)
+    meta = cache.lookup(1)
+    assert meta['version'] == 7
+    destination = tmp_path / 'job' / 'place.rbxl'
+    assert cache.copy_to(1, str(destination), meta['sha256'])
+    assert destination.read_bytes() == b'place' * 10
+
+
+def test_evicted_place_loses_its_sidecar(tmp_path):
+    cache_dir = tmp_path / 'places'
+    cache = PlaceCache(str(cache_dir), max_bytes=1024, max_entries=1)
+    _publish(cache, tmp_path, 1, 7)
+    os.utime(cache.path_for(1), (0, 0))
+    _publish(cache, tmp_path, 2, 3)
+    assert cache.lookup(1) is None
+    assert cache.lookup(2)['version'] == 3
+    assert sorted(os.listdir(cache_dir)) == ['2.rbxl', '2.rbxl.json']
+
+
+def test_partial_files_count_toward_the_limit_and_expire(tmp_path):
+    cache_dir = tmp_path / 'archives'
+    cache = ArchiveCache(str(cache_dir), max_bytes=250, max_entries=10)
+    cache.partial_max_age = 3600
+    fresh = cache.partial_path_for('fresh')
+    with open(fresh, 'wb') as f:
+        f.write(b'x' * 100)
+    stale = cache.partial_path_for('stale')
+    with open(stale, 'wb') as f:
+        f.write(b'x' * 100)
+    os.utime(stale, (0, 0))
+    for sha in ('old', 'new'):
+        source = tmp_path / f"{sha}.zip"
+        source.write_bytes(b'z' * 100)
+        cache.put(sha, str(source))
+    assert not os.path.exists(stale)
+    # The fresh partial may still be downloading, so the older archive goes instead
+    assert os.path.exists(fresh)
+    assert cache.get('old') is None
+    assert cache.get('new') is not None
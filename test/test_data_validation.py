@@ -0,0 +1,63 @@
+import asyncio
+import os
+
+from data_validation import check_luau, validate_data_files
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def test_lune_sync_script_passes():
+    with open(os.path.join(REPO_DIR, 'lune_sync.luau'), 'r', encoding='utf-8') as f:
+        assert check_luau(f.read()) == []
+
+def test_if_expressions_need_no_end():
+    assert check_luau('local x = if a then 1 else 2\nreturn {x = x}') == []
+    assert check_luau('return {a = if x then if y then 1 else 2 else 3, b = f(if z then 1 else 0)}') == []
+    assert check_luau('local y = if a then 1 elseif b then 2 else 3') == []
+    assert check_luau('local s = "n" .. if a then "1" else "2"') == []
+
+def test_if_statements_still_need_end():
+    assert check_luau('if a then if b then f() end end') == []
+    assert check_luau('if a then x = if b then 1 else 2 else y = 3 end') == []
+    assert check_luau('local x = 1\nif x then\n\treturn x\n') == [(2, "'if' is never closed")]
+
+def test_data_module():
+    source = (
+        '-- Unit stats\n'
+        'local Units = {}\n'
+        'Units.Sword = {\n'
+        '\tdamage = 10, -- [[ not a long comment ]]\n'
+        '\tname = "Sword \\"Mk II\\"",\n'
+        '\tnote = [[multi\nline]],\n'
+        '\trange = if game then 5 else 4,\n'
+        '}\n'
+        'function Units.get(name)\n'
+        '\tfor key, unit in pairs(Units) do\n'
+        '\t\tif key == name then return unit end\n'
+        '\tend\n'
+        '\trepeat local done = true until done\n'
+        'end\n'
+        'return Units\n'
+    )
+    assert check_luau(source) == []
+
+def test_structural_errors():
+    assert check_luau('return {\n\ta = 1,\n') == [(1, "'{' is never closed")]
+    assert check_luau('local s = "abc\nreturn s') == [(1, "unfinished string")]
+    assert check_luau('local function f()\n\treturn 1\n') == [(1, "'function' is never closed")]
+    assert check_luau('return 1 end') == [(1, "'end' without a matching block")]
+    assert check_luau('local x = if a then 1') == [(1, "'if' expression without an 'else'")]
+
+def test_pool_validation_from_a_worker_thread(tmp_path):
+    for index in range(60):
+        (tmp_path / f"item{index}.json").write_text(f'{{"id": {index}}}')
+    (tmp_path / 'broken.json').write_text('{"id": ')
+    (tmp_path / 'Module.luau').write_text('return {\n')
+
+    async def run():
+        # The bot validates from an executor thread while its event loop keeps running
+        return await asyncio.get_running_loop().run_in_executor(None, validate_data_files, str(tmp_path), '', 2)
+
+    errors = asyncio.run(run())
+    assert len(errors) == 2
+    assert 'Module.luau' in str(errors[0])
+    assert 'broken.json' in str(errors[1])
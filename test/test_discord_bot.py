@@ -0,0 +1,47 @@
+import asyncio
+from types import SimpleNamespace
+
+import discord_bot
+from metrics import MetricsStore, Span
+
+
+class FakeResponse:
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, content=None, embed=None, ephemeral=False):
+        self.sent.append((content, embed, ephemeral))
+
+
+def _interaction(allowed=True):
+    client = SimpleNamespace(has_permission=lambda user: allowed)
+    return SimpleNamespace(client=client, user=SimpleNamespace(id=1, roles=[]), response=FakeResponse())
+
+
+def _store(tmp_path, monkeypatch, names):
+    store = MetricsStore(str(tmp_path / 'metrics.jsonl'))
+    for name in names:
+        store.record(Span(name))
+    monkeypatch.setattr(discord_bot, 'metrics_store', store)
+
+
+def test_sync_stats_needs_permission(tmp_path, monkeypatch):
+    _store(tmp_path, monkeypatch, ['stage.total'])
+    interaction = _interaction(allowed=False)
+    asyncio.run(discord_bot.sync_stats_command_handler(interaction))
+    content, embed, ephemeral = interaction.response.sent[0]
+    assert "permission" in content
+    assert embed is None and ephemeral
+
+
+def test_sync_stats_keeps_code_blocks_closed(tmp_path, monkeypatch):
+    names = [f"stage.step_{index:03d}_with_a_long_name" for index in range(60)]
+    _store(tmp_path, monkeypatch, names + ['github.compare_commits'])
+    interaction = _interaction()
+    asyncio.run(discord_bot.sync_stats_command_handler(interaction))
+    _, embed, _ = interaction.response.sent[0]
+    stages = embed.fields[0].value
+    assert len(stages) <= 1024
+    assert stages.startswith("```\n") and stages.endswith("\n```")
+    assert " more\n```" in stages
+    assert embed.fields[1].value.endswith("\n```")
@@ -0,0 +1,169 @@
+import asyncio
+
+import aiohttp
+import pytest
+from aiohttp import web
+
+from downloader import download_file
+from rate_limit import RateLimitError, RequestError, RequestScheduler, TransientError
+
+
+async def _download(tmp_path, handler, **kwargs):
+    app = web.Application()
+    app.router.add_get('/zipball', handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    try:
+        async with aiohttp.ClientSession() as session:
+            return await download_file(session, f"http://127.0.0.1:{port}/zipball", str(tmp_path / 'repo.zip'),
+                                       error_prefix="Failed to download repository", **kwargs)
+    finally:
+        await runner.cleanup()
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr('config.Config.DOWNLOAD_BACKOFF_SECONDS', 0)
+
+
+def test_download_writes_file(tmp_path):
+    async def handler(request):
+        return web.Response(body=b'zip' * 100)
+
+    assert asyncio.run(_download(tmp_path, handler)) == 300
+    assert (tmp_path / 'repo.zip').read_bytes() == b'zip' * 100
+
+
+def test_not_found_is_a_request_error(tmp_path):
+    calls = []
+
+    async def handler(request):
+        calls.append(request)
+        return web.Response(status=404)
+
+    with pytest.raises(RequestError) as raised:
+        asyncio.run(_download(tmp_path, handler, retries=3))
+    assert type(raised.value) is RequestError
+    assert raised.value.status == 404
+    assert str(raised.value) == "Failed to download repository: 404"
+    assert len(calls) == 1
+
+
+def test_server_errors_raise_transient_error_after_retries(tmp_path):
+    calls = []
+
+    async def handler(request):
+        calls.append(request)
+        return web.Response(status=502)
+
+    with pytest.raises(TransientError) as raised:
+        asyncio.run(_download(tmp_path, handler, retries=2))
+    assert raised.value.status == 502
+    assert len(calls) == 3
+
+
+def test_github_rate_limit_403_is_retried_and_pauses_the_scheduler(tmp_path):
+    calls = []
+
+    async def handler(request):
+        calls.append(request)
+        return web.Response(status=403, headers={'X-RateLimit-Remaining': '0', 'Retry-After': '0'})
+
+    scheduler = RequestScheduler('GitHub', 6000)
+    with pytest.raises(RateLimitError) as raised:
+        asyncio.run(_download(tmp_path, handler, retries=1, scheduler=scheduler))
+    assert raised.value.status == 403
+    assert len(calls) == 2
+
+
+def test_forbidden_without_rate_limit_is_not_retried(tmp_path):
+    calls = []
+
+    async def handler(request):
+        calls.append(request)
+        return web.Response(status=403, headers={'X-RateLimit-Remaining': '4999'})
+
+    with pytest.raises(RequestError) as raised:
+        asyncio.run(_download(tmp_path, handler, retries=3))
+    assert not isinstance(raised.value, RateLimitError)
+    assert len(calls) == 1
+
+
+def _range_server(body, etag, calls, honor_range=True):
+    async def handler(request):
+        calls.append(dict(request.headers))
+        range_header = request.headers.get('Range')
+        if_range = request.headers.get('If-Range')
+        if honor_range and range_header and (if_range is None or if_range == etag):
+            start = int(range_header[len('bytes='):].rstrip('-'))
+            return web.Response(status=206, body=body[start:], headers={
+                'ETag': etag, 'Content-Range': f"bytes {start}-{len(body) - 1}/{len(body)}"
+            })
+        return web.Response(body=body, headers={'ETag': etag})
+    return handler
+
+
+def _partial(tmp_path, data, validator=None):
+    (tmp_path / 'repo.zip').write_bytes(data)
+    if validator:
+        (tmp_path / 'repo.zip.validator').write_text(validator)
+
+
+def test_resumes_partial_file_with_stored_validator(tmp_path):
+    body = bytes(range(256)) * 40
+    calls = []
+    _partial(tmp_path, body[:4000], '"v1"')
+    assert asyncio.run(_download(tmp_path, _range_server(body, '"v1"', calls))) == len(body)
+    assert calls[0]['Range'] == 'bytes=4000-'
+    assert calls[0]['If-Range'] == '"v1"'
+    assert (tmp_path / 'repo.zip').read_bytes() == body
+    assert not (tmp_path / 'repo.zip.validator').exists()
+
+
+def test_server_ignoring_range_restarts_from_zero(tmp_path):
+    body = bytes(range(256)) * 40
+    calls = []
+    _partial(tmp_path, body[:4000], '"v1"')
+    asyncio.run(_download(tmp_path, _range_server(body, '"v1"', calls, honor_range=False)))
+    assert calls[0]['Range'] == 'bytes=4000-'
+    assert (tmp_path / 'repo.zip').read_bytes() == body
+
+
+def test_changed_resource_is_downloaded_again(tmp_path):
+    old, new = b'a' * 10000, b'b' * 12000
+    calls = []
+    _partial(tmp_path, old[:4000], '"v1"')
+    asyncio.run(_download(tmp_path, _range_server(new, '"v2"', calls)))
+    assert calls[0]['If-Range'] == '"v1"'
+    assert (tmp_path / 'repo.zip').read_bytes() == new
+
+
+def test_partial_file_without_validator_is_not_resumed(tmp_path):
+    body = bytes(range(256)) * 40
+    calls = []
+    _partial(tmp_path, b'stale bytes from an unknown version')
+    asyncio.run(_download(tmp_path, _range_server(body, '"v1"', calls)))
+    assert 'Range' not in calls[0]
+    assert (tmp_path / 'repo.zip').read_bytes() == body
+
+
+def test_interrupted_download_keeps_buffered_bytes(tmp_path):
+    body = bytes(range(256)) * 400
+
+    async def handler(request):
+        response = web.StreamResponse(headers={'ETag': '"v1"'})
+        response.content_length = len(body)
+        await response.prepare(request)
+        await response.write(body[:50000])
+        await asyncio.sleep(0.05)
+        request.transport.close()
+        return response
+
+    with pytest.raises(TransientError):
+        asyncio.run(_download(tmp_path, handler, retries=0, buffer_size=1024 * 1024))
+    partial = (tmp_path / 'repo.zip').read_bytes()
+    assert partial and body.startswith(partial)
+    assert (tmp_path / 'repo.zip.validator').read_text() == '"v1"'
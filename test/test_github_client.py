@@ -0,0 +1,74 @@
+import asyncio
+import zipfile
+
+from aiohttp import web
+
+from config import Config
+from github_client import GitHubClient
+
+
+def _zipball(path, files):
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as zip_ref:
+        for name, data in files.items():
+            zip_ref.writestr(f"owner-repo-abc1234/{name}", data)
+
+
+def test_archive_check_accepts_complete_zip(tmp_path):
+    path = tmp_path / 'repo.zip'
+    _zipball(path, {'src/Data/items.json': '{"a": 1}' * 100})
+    assert GitHubClient._archive_ok(str(path))
+
+
+def test_archive_check_rejects_truncated_zip(tmp_path):
+    path = tmp_path / 'repo.zip'
+    _zipball(path, {'src/Data/items.json': '{"a": 1}' * 100})
+    data = path.read_bytes()
+    path.write_bytes(data[:len(data) // 2])
+    assert not GitHubClient._archive_ok(str(path))
+
+
+def test_archive_check_rejects_corrupt_member(tmp_path):
+    path = tmp_path / 'repo.zip'
+    _zipball(path, {'src/Data/items.json': 'x' * 4096})
+    data = bytearray(path.read_bytes())
+    # Flip a byte inside the stored member so only its CRC catches it
+    offset = data.index(b'items.json') + len('items.json') + 10
+    data[offset] ^= 0xff
+    path.write_bytes(bytes(data))
+    assert not GitHubClient._archive_ok(str(path))
+
+
+def test_calls_share_one_pooled_session_until_closed(monkeypatch):
+    async def run():
+        peers = []
+
+        async def handler(request):
+            peers.append(request.transport.get_extra_info('peername'))
+            return web.json_response({'sha': request.match_info['ref'], 'commit': {'message': 'm'}})
+
+        app = web.Application()
+        app.router.add_get('/repos/{owner}/{repo}/commits/{ref}', handler)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        monkeypatch.setattr(Config, 'GITHUB_API_URL', f"http://127.0.0.1:{port}")
+        client = GitHubClient()
+        try:
+            await client.start()
+            session = client.session
+            connector = session.connector
+            for ref in ('main', 'dev', 'v1'):
+                assert (await client.get_latest_commit(ref))['sha'] == ref
+            assert client.session is session
+            # Keep-alive: the later calls reuse the first call's connection
+            assert len(peers) == 3 and len(set(peers)) == 1
+            await client.close()
+            assert session.closed and connector.closed
+            assert client.session is None
+        finally:
+            await client.close()
+            await runner.cleanup()
+
+    asyncio.run(run())
@@ -0,0 +1,127 @@
+import json
+import re
+
+import pytest
+
+from luau_serializer import compile_json, to_luau
+
+class LuauTableReader:
+    """Read a Luau table constructor into what Luau builds from it.
+
+    Tables become dicts keyed like Luau keys them (positional items get 1, 2, ...),
+    and nil values are simply absent, as they are in a Luau table.
+    """
+
+    _NUMBER = re.compile(r'-?(?:\d+\.?\d*(?:[eE][+-]?\d+)?|\.\d+)')
+    _NAME = re.compile(r'[A-Za-z_][A-Za-z0-9_]*')
+    _ESCAPES = {'n': '\n', 'r': '\r', 't': '\t', '\\': '\\', '"': '"', "'": "'"}
+
+    def __init__(self, text):
+        self.text = text
+        self.pos = 0
+
+    def read(self):
+        value = self.value()
+        assert self.pos == len(self.text), f"trailing input at {self.pos}"
+        return value
+
+    def value(self):
+        char = self.text[self.pos]
+        if char == '{':
+            return self.table()
+        if char == '"':
+            return self.string()
+        name = self._NAME.match(self.text, self.pos)
+        if name:
+            self.pos = name.end()
+            return {'nil': None, 'true': True, 'false': False}[name.group(0)]
+        number = self._NUMBER.match(self.text, self.pos)
+        self.pos = number.end()
+        return float(number.group(0))
+
+    def string(self):
+        self.pos += 1
+        out = []
+        while self.text[self.pos] != '"':
+            char = self.text[self.pos]
+            self.pos += 1
+            if char != '\\':
+                out.append(char)
+            elif self.text[self.pos].isdigit():
+                digits = re.match(r'\d{1,3}', self.text[self.pos:]).group(0)
+                out.append(chr(int(digits)))
+                self.pos += len(digits)
+            else:
+                out.append(self._ESCAPES[self.text[self.pos]])
+                self.pos += 1
+        self.pos += 1
+        return ''.join(out)
+
+    def table(self):
+        self.pos += 1
+        table, index = {}, 1
+        while self.text[self.pos] != '}':
+            if self.text[self.pos] == '[':
+                self.pos += 1
+                key = self.string()
+                assert self.text[self.pos:self.pos + 2] == ']='
+                self.pos += 2
+            else:
+                name = self._NAME.match(self.text, self.pos)
+                if name and self.text[name.end():name.end() + 1] == '=':
+                    key = name.group(0)
+                    self.pos = name.end() + 1
+                else:
+                    key, index = float(index), index + 1
+            value = self.value()
+            if value is not None:
+                table[key] = value
+            if self.text[self.pos] == ',':
+                self.pos += 1
+        self.pos += 1
+        return table
+
+def as_luau(value):
+    """What a decoded JSON value must look like once Luau has built it, with arrays usable by ipairs."""
+    if isinstance(value, list):
+        return {float(index + 1): as_luau(item) for index, item in enumerate(value)}
+    if isinstance(value, dict):
+        return {key: as_luau(item) for key, item in value.items() if item is not None}
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    return value
+
+def round_trip(value):
+    source = compile_json(json.dumps(value))
+    assert source.startswith('return ') and source.endswith('\n')
+    return LuauTableReader(source[len('return '):-1]).read()
+
+@pytest.mark.parametrize('value', [
+    {'name': 'Sword', 'damage': 10, 'speed': 1.25, 'tags': ['melee', 'starter'], 'enabled': True},
+    {'and': 1, 'end': 2, 'type': 3, 'with space': 4, '1st': 5, 'ok_key': 6},
+    {'text': 'quote " backslash \\ newline \n tab \t cr \r nul \x00 bell \x07 del \x7f then 1'},
+    {'unicode': 'ünïcødé ✓ 🗡️'},
+    {'floats': [0.1, -2.5, 1e-07, 1.5e+300, 3.0], 'ints': [0, -1, 2 ** 53, -(2 ** 53)]},
+    {'nested': [[1, 2], [], {}, [{'a': [True, False]}]]},
+    {'dropped': None, 'kept': 1},
+    [],
+    {},
+])
+def test_round_trip_matches_luau_tables(value):
+    assert round_trip(value) == as_luau(value)
+
+def test_exact_output():
+    assert to_luau({'b': [1, 2.5, 'x'], 'a': {'end': False}, 'c': None}) == '{a={["end"]=false},b={1,2.5,"x"}}'
+    assert to_luau('\x00\x01' + '1') == '"\\000\\0011"'
+    assert to_luau(3.0) == '3'
+    assert to_luau(2 ** 60) == '1152921504606846976'
+
+def test_null_in_array_is_rejected():
+    for value in ([1, None, 3], [None], {'list': [1, None]}):
+        with pytest.raises(ValueError, match='null'):
+            compile_json(json.dumps(value))
+
+def test_non_finite_numbers_are_rejected():
+    for text in ('{"a": NaN}', '[Infinity]', '-Infinity'):
+        with pytest.raises(ValueError):
+            compile_json(text)
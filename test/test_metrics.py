@@ -0,0 +1,48 @@
+import asyncio
+import json
+
+from metrics import MetricsStore, Span
+
+
+def _lines(path):
+    return [json.loads(line) for line in path.read_text(encoding='utf-8').splitlines()]
+
+
+def test_spans_are_written_in_the_background(tmp_path):
+    path = tmp_path / 'metrics.jsonl'
+    store = MetricsStore(str(path), max_samples=50)
+
+    async def run():
+        for index in range(5):
+            async with store.span('stage.data', index=index):
+                pass
+        # Nothing was written on the event loop itself
+        assert not path.exists()
+        await store.flush()
+
+    asyncio.run(run())
+    assert [sample['index'] for sample in _lines(path)] == [0, 1, 2, 3, 4]
+    assert store.summary()['stage.data']['count'] == 5
+
+
+def test_file_is_compacted_to_the_kept_samples(tmp_path):
+    path = tmp_path / 'metrics.jsonl'
+    store = MetricsStore(str(path), max_samples=3)
+
+    async def run():
+        for index in range(20):
+            async with store.span('stage.lune', index=index):
+                pass
+            await store.flush()
+
+    asyncio.run(run())
+    assert len(_lines(path)) <= 2 * 3
+    reloaded = MetricsStore(str(path), max_samples=3)
+    assert reloaded.summary()['stage.lune']['count'] == 3
+
+
+def test_record_without_event_loop_writes_immediately(tmp_path):
+    path = tmp_path / 'metrics.jsonl'
+    store = MetricsStore(str(path))
+    store.record(Span('github.compare_commits'))
+    assert _lines(path)[0]['name'] == 'github.compare_commits'
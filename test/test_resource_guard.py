@@ -0,0 +1,36 @@
+import asyncio
+import sys
+
+import pytest
+
+from resource_guard import ResourceLimitError, RunResources, current_rss
+
+
+def test_check_fails_over_scratch_limit(tmp_path):
+    (tmp_path / 'place.rbxl').write_bytes(b'x' * 2048)
+    resources = RunResources(str(tmp_path), max_bytes=1024, min_free_bytes=0)
+    with pytest.raises(ResourceLimitError, match='SCRATCH_MAX_MB'):
+        asyncio.run(resources.check('Place download'))
+    assert resources.peak_disk == 2048
+
+
+def test_available_counts_tracked_files(tmp_path):
+    workdir = tmp_path / 'job'
+    workdir.mkdir()
+    (workdir / 'data.json').write_bytes(b'x' * 100)
+    partial = tmp_path / 'archive.zip.part'
+    partial.write_bytes(b'x' * 300)
+    resources = RunResources(str(workdir), max_bytes=1000, min_free_bytes=0)
+    resources.track(str(partial))
+    assert asyncio.run(resources.available()) == 600
+    resources.untrack(str(partial))
+    assert asyncio.run(resources.available()) == 900
+
+
+def test_current_rss_without_proc_or_resource_module(monkeypatch):
+    def no_proc(*args, **kwargs):
+        raise OSError('no /proc')
+
+    monkeypatch.setattr('builtins.open', no_proc)
+    monkeypatch.setitem(sys.modules, 'resource', None)
+    assert current_rss() == 0
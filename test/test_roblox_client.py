@@ -0,0 +1,73 @@
+import asyncio
+
+import pytest
+
+from rate_limit import RateLimitError, RequestError, TransientError
+from roblox_client import RobloxClient
+
+
+def test_manifest_lists_removals_before_changes(tmp_path):
+    path = tmp_path / 'place.rbxl.manifest'
+    compiled = {'Units/Axe.json': ('abc-v1', str(tmp_path / 'abc-v1.luau'))}
+    RobloxClient._write_manifest(
+        str(path), {'Units/Sword.luau': 'abc', 'Units/Axe.json': 'def'}, ['Units/Sword.json'], compiled
+    )
+    lines = path.read_text(encoding='utf-8').splitlines()
+    assert lines[0] == 'D\t-\tUnits/Sword.json'
+    assert lines[1] == f"M\tabc-v1\tUnits/Axe.json\t{tmp_path / 'abc-v1.luau'}"
+    assert lines[2] == 'M\tabc\tUnits/Sword.luau'
+
+
+def _failing_client(monkeypatch, message):
+    client = RobloxClient()
+    calls = []
+
+    async def run_command(cmd, timeout, error_prefix):
+        calls.append(cmd)
+        raise Exception(f"{error_prefix}: {message}")
+
+    monkeypatch.setattr(client, '_run_command', run_command)
+    monkeypatch.setattr(client.scheduler, 'max_retries', 1)
+    monkeypatch.setattr(client.scheduler, 'retry_delay', lambda attempt: 0)
+    return client, calls
+
+
+def test_open_cloud_rate_limit_raises_rate_limit_error(monkeypatch):
+    client, calls = _failing_client(monkeypatch, "HTTP status 429 Too Many Requests")
+    with pytest.raises(RateLimitError) as raised:
+        asyncio.run(client._run_open_cloud(['rbxcloud'], "Failed to publish place"))
+    assert raised.value.status == 429
+    assert len(calls) == 2
+
+
+def test_open_cloud_server_error_raises_transient_error(monkeypatch):
+    client, calls = _failing_client(monkeypatch, "HTTP status 503 Service Unavailable")
+    with pytest.raises(TransientError) as raised:
+        asyncio.run(client._run_open_cloud(['rbxcloud'], "Failed to publish place"))
+    assert raised.value.status == 503
+    assert len(calls) == 2
+
+
+def test_open_cloud_client_error_is_not_retried(monkeypatch):
+    client, calls = _failing_client(monkeypatch, "HTTP status 403 Forbidden")
+    with pytest.raises(Exception) as raised:
+        asyncio.run(client._run_open_cloud(['rbxcloud'], "Failed to publish place"))
+    assert not isinstance(raised.value, RequestError)
+    assert len(calls) == 1
+
+
+def test_session_is_shared_and_released_on_close():
+    async def run():
+        client = RobloxClient()
+        first = await client._get_session()
+        connector = first.connector
+        assert await client._get_session() is first
+        await client.close()
+        assert first.closed and connector.closed
+        assert client.session is None
+        # A later call opens a fresh pool instead of using the closed one
+        second = await client._get_session()
+        assert second is not first and not second.closed
+        await client.close()
+
+    asyncio.run(run())
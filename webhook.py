@@ -0,0 +1,121 @@
+import asyncio
+import hashlib
+import hmac
+import json
+import logging
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+def verify_signature(secret: str, body: bytes, signature_header: str) -> bool:
+    """Check GitHub's X-Hub-Signature-256 header ("sha256=<hex hmac>") against the raw body."""
+    if not secret or not signature_header or not signature_header.startswith('sha256='):
+        return False
+    expected = hmac.new(secret.encode('utf-8'), body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, signature_header[len('sha256='):])
+
+def push_touches_data(payload: dict, data_roots) -> bool:
+    """Return True if any commit in a push event adds, modifies or removes a file under a data root.
+
+    GitHub lists at most 20 commits per push event; a larger push is assumed to
+    touch the data (the deploy itself still skips publishing if nothing changed).
+    """
+    commits = payload.get('commits') or []
+    if len(commits) >= 20:
+        return True
+    prefixes = [root.rstrip('/') + '/' for root in data_roots]
+    for commit in commits:
+        for key in ('added', 'modified', 'removed'):
+            for path in commit.get(key) or []:
+                if any(path.startswith(prefix) for prefix in prefixes):
+                    return True
+    return False
+
+class PushDebouncer:
+    """Collapse bursts of pushes per branch into one deploy.
+
+    Every push restarts the branch's timer; `callback(branch, pushes)` runs once no
+    further push has arrived for `delay` seconds.
+    """
+
+    def __init__(self, delay, callback):
+        self.delay = delay
+        self.callback = callback
+        self._timers = {}
+        self._counts = {}
+
+    def push(self, branch: str):
+        timer = self._timers.get(branch)
+        if timer is not None:
+            timer.cancel()
+        self._counts[branch] = self._counts.get(branch, 0) + 1
+        self._timers[branch] = asyncio.get_running_loop().call_later(self.delay, self._fire, branch)
+
+    def _fire(self, branch):
+        self._timers.pop(branch, None)
+        pushes = self._counts.pop(branch, 0)
+        task = asyncio.ensure_future(self.callback(branch, pushes))
+        task.add_done_callback(self._log_failure)
+
+    @staticmethod
+    def _log_failure(task):
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Webhook deploy failed: {task.exception()}")
+
+    def cancel(self):
+        for timer in self._timers.values():
+            timer.cancel()
+        self._timers.clear()
+        self._counts.clear()
+
+async def start_webhook_server(on_push, host=None, port=None, path=None):
+    """Serve GitHub push webhooks. Returns (aiohttp runner, debouncer) to clean up.
+
+    Pushes to the watched branches of GITHUB_REPO that touch a data root are
+    passed to `on_push(branch, pushes)` after WEBHOOK_DEBOUNCE_SECONDS of quiet.
+    """
+    from aiohttp import web
+
+    debouncer = PushDebouncer(Config.WEBHOOK_DEBOUNCE_SECONDS, on_push)
+    branches = set(Config.WEBHOOK_BRANCHES)
+
+    async def handle_webhook(request):
+        body = await request.read()
+        if not verify_signature(Config.WEBHOOK_SECRET, body, request.headers.get('X-Hub-Signature-256', '')):
+            logger.warning(f"Rejected webhook from {request.remote}: bad signature")
+            return web.Response(status=401, text='bad signature')
+        event = request.headers.get('X-GitHub-Event', '')
+        if event == 'ping':
+            return web.Response(text='pong')
+        if event != 'push':
+            return web.Response(status=202, text=f'ignored event {event}')
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            return web.Response(status=400, text='invalid JSON')
+
+        repo = (payload.get('repository') or {}).get('full_name', '')
+        ref = payload.get('ref', '')
+        branch = ref[len('refs/heads/'):] if ref.startswith('refs/heads/') else None
+        if Config.GITHUB_REPO and repo.lower() != Config.GITHUB_REPO.lower():
+            return web.Response(status=202, text='ignored repository')
+        if branch is None or branch not in branches or payload.get('deleted'):
+            return web.Response(status=202, text='ignored ref')
+        if not push_touches_data(payload, Config.DATA_ROOTS):
+            logger.info(f"Push to {branch} does not touch the data roots, not deploying")
+            return web.Response(status=202, text='no data changes')
+
+        debouncer.push(branch)
+        logger.info(f"Push to {branch} queued, deploying after {Config.WEBHOOK_DEBOUNCE_SECONDS}s without further pushes")
+        return web.Response(status=202, text='deploy scheduled')
+
+    app = web.Application(client_max_size=Config.WEBHOOK_MAX_BODY_BYTES)
+    app.router.add_post(path or Config.WEBHOOK_PATH, handle_webhook)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, host or Config.WEBHOOK_HOST, port or Config.WEBHOOK_PORT)
+    await site.start()
+    logger.info(
+        f"GitHub webhook listening on http://{host or Config.WEBHOOK_HOST}:{port or Config.WEBHOOK_PORT}{path or Config.WEBHOOK_PATH}"
+    )
+    return runner, debouncer